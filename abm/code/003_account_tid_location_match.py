@@ -8,30 +8,49 @@ Input:
 
 Output:
     1) account_tid_location_match:
-    - A dictionary, for each day, with a mapping from account id to tweet ids
-        - Form (dict): {user_id : [tweet_id]}
-        - Form (dict): {user_id : location}
-    2) "Global" account_id -> location dictionary:
-        - Dictionary mapping account id to location for all days
+    - A table (.parquet), for each day, with one row per tweet
+        - Columns: | account_id | tweet_id |
+    - A table (.parquet), for each day, with the location of each account
+        - Columns: | account_id | location | country | state | county | city | carmen_id |
+    2) "Global" account_id -> location table:
+        - Table with the same columns as above for all days
             - Uses the last appearing location
+    3) A persistent carmen resolution cache (.sqlite) shared by all days
+        - Maps each distinct profile location string to its carmen match
+
+Note: older versions of this script saved daily account -> tweet ids mappings and
+    daily locations as pickled dictionaries, with the carmen match stored as
+    `str(Location)`. Those files are converted to the tables above (once) by
+    `migrate_legacy_pickles`.
 
 Authors:
     - Francesco Pierri
     - Matthew DeVerna
 """
+import ast
 import gzip
 import json
 import os
+import sqlite3
 import tldextract
 
 import pickle as pkl
 import glob as glob
+import numpy as np
+import pandas as pd
 
 from carmen import get_resolver
-from collections import defaultdict
 from datetime import datetime as dt
 
-from utils import parse_cl_args, parse_config_file
+from utils import (
+    build_location_table,
+    parse_cl_args,
+    parse_config_file,
+)
+
+# Fields of the carmen Location object that we keep
+CARMEN_FIELDS = ["country", "state", "county", "city", "id"]
+NO_MATCH = (None,) * len(CARMEN_FIELDS)
 
 
 def extract_top_domain(url):
@@ -52,6 +71,114 @@ def extract_top_domain(url):
     return f"{domain}.{suffix}".lower()
 
 
+class CarmenCache:
+    """
+    A persistent cache of carmen resolutions keyed on the profile location string.
+
+    We only pass the "user" object to carmen, so its profile resolver is the only
+    one that can match and it only reads `user["location"]`. Every account sharing
+    the same location string therefore resolves to the same match, which lets us
+    resolve each distinct string once for the whole corpus. Resolutions are kept
+    in memory during a run and persisted to a small sqlite key-value store so that
+    they are reused across days (and across runs).
+    """
+
+    def __init__(self, resolver, cache_path):
+        """
+        Parameters:
+        ----------
+        - resolver : a carmen resolver with its locations already loaded
+        - cache_path (str) : path to the sqlite file backing the cache
+        """
+        self._resolver = resolver
+        self._conn = sqlite3.connect(cache_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS carmen_locations "
+            "(location TEXT PRIMARY KEY, country TEXT, state TEXT, county TEXT, "
+            "city TEXT, carmen_id INTEGER)"
+        )
+        self._memory = dict()
+        self._new_entries = []
+        self.hits = 0
+        self.misses = 0
+
+    def _resolve(self, account):
+        """Run carmen on `account` and return the fields of its match."""
+        # trick to use carmen
+        result = self._resolver.resolve_tweet({"user": account})
+        if not result:
+            return NO_MATCH
+        # result[1] is a Location() object. E.g.
+        #       Location(
+        #           country='United Kingdom',
+        #           state='England',
+        #           county='London',
+        #           city='London',
+        #           known=True,
+        #           id=2206
+        #       )
+        return tuple(getattr(result[1], field) for field in CARMEN_FIELDS)
+
+    def resolve(self, account):
+        """
+        Return the carmen match of `account`, resolving it only if its location
+        string has never been seen before.
+
+        Parameters:
+        ----------
+        - account (dict) : a Twitter user object
+
+        Returns:
+        ----------
+        - tuple : (country, state, county, city, carmen_id) of the match. All
+            values are None if carmen found no match.
+        """
+        key = account.get("location") or ""
+        if key in self._memory:
+            self.hits += 1
+            return self._memory[key]
+
+        row = self._conn.execute(
+            "SELECT country, state, county, city, carmen_id "
+            "FROM carmen_locations WHERE location = ?",
+            (key,),
+        ).fetchone()
+        if row is not None:
+            self.hits += 1
+            match = tuple(row)
+        else:
+            self.misses += 1
+            match = self._resolve(account)
+            self._new_entries.append((key, *match))
+        self._memory[key] = match
+        return match
+
+    def flush(self):
+        """Persist all newly resolved locations to disk."""
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO carmen_locations VALUES (?, ?, ?, ?, ?, ?)",
+            self._new_entries,
+        )
+        self._conn.commit()
+        self._new_entries = []
+
+    def report(self, label):
+        """Print and reset the hit/miss statistics collected since the last report."""
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        print(
+            f"{label} carmen cache: {self.hits:,} hits, {self.misses:,} misses "
+            f"({hit_rate:.2%} hit rate, {len(self._memory):,} locations in memory)"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """Persist any pending entries and close the underlying database."""
+        self.flush()
+        self._conn.close()
+
+
 ## This function runs on the CoVaxxy dataset streaming files ##
 # See dataset paper here: https://doi.org/10.1609/icwsm.v15i1.18122
 # Tweet IDs can be found here for rehydration: https://zenodo.org/records/7752586
@@ -59,18 +186,26 @@ def account_tid_location_match(config):
     """
     Function to match tweets with accounts (and their locations). It processes daily Twitter files and checks for existing
     output to avoid repeating computations.
+    Carmen resolutions are looked up in (and added to) a persistent cache so that each
+    distinct profile location string is only resolved once across all days.
     Parameters:
         config (dict): A dictionary with config information about paths and filenames.
     Output:
-        1) It saves a dictionary {'account_id' : [tweet_id]} which contains the list of tweets shared by each account on
+        1) It saves a table | account_id | tweet_id | which contains the tweets shared by each account on
         each day
-        2) It saves a dictionary {'account_id' : {'location': str, 'carmen_location': str} } which contains the location
-         of each account (and the carmen match) on each day
+        2) It saves a table | account_id | location | country | state | county | city | carmen_id | which
+        contains the location of each account (and the carmen match) on each day
     """
 
     # Initialize carmen geolocation
     resolver = get_resolver()
     resolver.load_locations()
+    cache = CarmenCache(
+        resolver,
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["CARMEN_CACHE"]
+        ),
+    )
 
     sorted_files = sorted(
         glob.glob(config["PATHS"]["STREAMING_FILES_FOLDER"] + "/*json.gz*")
@@ -82,82 +217,182 @@ def account_tid_location_match(config):
         print(day)
 
         output_path = os.path.join(
-            config["PATHS"]["ACCOUNTS_DATA_FOLDER"], str(day) + "_account_tids_dict.pkl"
+            config["PATHS"]["ACCOUNTS_DATA_FOLDER"],
+            str(day) + "_account_tweets.parquet",
         )
         if os.path.exists(output_path):
             print("Already processed!")
             continue
 
-        daily_account_tweet_ids = defaultdict(list)
-        daily_account_location_match = defaultdict(dict)
+        daily_account_ids = []
+        daily_tweet_ids = []
+        daily_account_location_match = dict()
 
         with gzip.open(file, "r") as f:
             for line in f:
                 try:
                     j = json.loads(line)
                     a_id = j["user"]["id"]
+                    tweet_id = j["id"]
 
                     # append tweets shared in that day
-                    daily_account_tweet_ids[a_id].append(j["id_str"])
+                    daily_account_ids.append(a_id)
+                    daily_tweet_ids.append(tweet_id)
                     account = j["user"]
                     aid = account["id"]
 
-                    daily_account_location_match[aid] = {
-                        "location": account["location"]
-                    }
-
-                    # trick to use carmen
-                    result = resolver.resolve_tweet({"user": account})
-                    if not result:
-                        match = "No match!"
-                    else:
-                        # result[1] is a Location() object. E.g.
-                        #       Location(
-                        #           country='United Kingdom',
-                        #           state='England',
-                        #           county='London',
-                        #           city='London',
-                        #           known=True,
-                        #           id=2206
-                        #       )
-                        match = str(result[1])
-
-                    daily_account_location_match[aid]["carmen_location"] = match
+                    match = cache.resolve(account)
+                    daily_account_location_match[aid] = (account["location"], *match)
 
                 except Exception as e:
                     print(e)
                     print(j)
 
-        pkl.dump(
-            daily_account_tweet_ids,
-            open(
-                output_path,
-                "wb",
+        cache.flush()
+        cache.report(day)
+
+        pd.DataFrame(
+            {
+                "account_id": np.array(daily_account_ids, dtype=np.int64),
+                "tweet_id": np.array(daily_tweet_ids, dtype=np.int64),
+            }
+        ).to_parquet(output_path, index=False)
+        build_location_table(
+            (aid, *record) for aid, record in daily_account_location_match.items()
+        ).to_parquet(
+            os.path.join(
+                config["PATHS"]["ACCOUNTS_DATA_FOLDER"],
+                str(day) + "_account_location.parquet",
             ),
+            index=False,
         )
-        pkl.dump(
-            daily_account_location_match,
-            open(
-                os.path.join(
-                    config["PATHS"]["ACCOUNTS_DATA_FOLDER"],
-                    str(day) + "_account_location_match.pkl",
-                ),
-                "wb",
-            ),
+
+    cache.close()
+
+
+def parse_carmen_location(match):
+    """
+    Parse the string form of a carmen Location saved by older versions of this
+    script, without running it through `eval`.
+
+    Parameters:
+    ----------
+    match (str): `str(Location)` (e.g., "Location(country='United Kingdom', ...)")
+        or "No match!"
+
+    Returns:
+    -------
+    tuple: (country, state, county, city, carmen_id). All values are None if
+        there was no match.
+    """
+    if match == "No match!":
+        return NO_MATCH
+
+    node = ast.parse(match, mode="eval").body
+    if not (isinstance(node, ast.Call) and getattr(node.func, "id", "") == "Location"):
+        raise ValueError(f"Not a carmen Location: {match}")
+
+    fields = dict()
+    for keyword in node.keywords:
+        if keyword.arg in CARMEN_FIELDS:
+            fields[keyword.arg] = ast.literal_eval(keyword.value)
+    return tuple(fields.get(field) for field in CARMEN_FIELDS)
+
+
+def location_pickle_to_table(location_match):
+    """
+    Convert a legacy {account_id : {'location': str, 'carmen_location': str}}
+    dictionary into a typed account location table.
+    """
+    return build_location_table(
+        (
+            aid,
+            acc["location"],
+            *parse_carmen_location(acc["carmen_location"]),
         )
+        for aid, acc in location_match.items()
+    )
+
+
+def account_tids_pickle_to_table(account_tweet_ids):
+    """
+    Convert a legacy {account_id : [tweet_id]} dictionary into an account tweets
+    table with int64 | account_id | tweet_id | columns.
+    """
+    table = (
+        pd.Series(account_tweet_ids, name="tweet_id", dtype=object)
+        .rename_axis("account_id")
+        .explode()
+        .dropna()
+        .reset_index()
+    )
+    return table.astype({"account_id": "int64", "tweet_id": "int64"})
+
+
+def migrate_legacy_pickles(config):
+    """
+    One-time conversion of the account -> tweet ids and location pickles created by
+    older versions of this script into tables. Files that already have a table are
+    skipped, so running this repeatedly does nothing after the first time.
+    """
+    legacy_files = sorted(
+        glob.glob(
+            os.path.join(
+                config["PATHS"]["ACCOUNTS_DATA_FOLDER"], "*_account_tids_dict.pkl"
+            )
+        )
+    )
+    for file in legacy_files:
+        output_path = file.replace("_account_tids_dict.pkl", "_account_tweets.parquet")
+        if os.path.exists(output_path):
+            continue
+        print(f"Migrating {os.path.basename(file)}")
+        account_tweet_ids = pkl.load(open(file, "rb"))
+        account_tids_pickle_to_table(account_tweet_ids).to_parquet(
+            output_path, index=False
+        )
+
+    legacy_files = sorted(
+        glob.glob(
+            os.path.join(
+                config["PATHS"]["ACCOUNTS_DATA_FOLDER"], "*_account_location_match.pkl"
+            )
+        )
+    )
+    for file in legacy_files:
+        output_path = file.replace(
+            "_account_location_match.pkl", "_account_location.parquet"
+        )
+        if os.path.exists(output_path):
+            continue
+        print(f"Migrating {os.path.basename(file)}")
+        location_match = pkl.load(open(file, "rb"))
+        location_pickle_to_table(location_match).to_parquet(output_path, index=False)
+
+    # The global dictionary may exist even when the daily files have been removed
+    legacy_global = os.path.join(
+        config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_LOCATION"]
+    )
+    global_path = os.path.join(
+        config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_LOCATION_TABLE"]
+    )
+    if os.path.exists(legacy_global) and not os.path.exists(global_path):
+        print(f"Migrating {os.path.basename(legacy_global)}")
+        location_match = pkl.load(open(legacy_global, "rb"))
+        location_pickle_to_table(location_match).to_parquet(global_path, index=False)
 
 
 ## This is specific to this project ##
 def build_global_location(config):
     """
-    Function to build a global dictionary account -> location (the last appearing is retained).
+    Function to build a global table account -> location (the last appearing is retained).
     """
 
     # Cutoff date. We do not consider streaming data files after this date.
     LAST_DAY = config["VARIABLES"]["LAST_DAY"]
     LAST_DAY = dt.strptime(LAST_DAY, "%Y-%m-%d")
 
-    account_location_match = dict()
+    daily_tables = []
     files_sorted = sorted(
         glob.glob(config["PATHS"]["RETWEET_NETWORK_FOLDER"] + "/*edgelist*")
     )
@@ -169,34 +404,28 @@ def build_global_location(config):
         )
         print(day)
 
+        if dt.strptime(day, "%Y-%m-%d") > LAST_DAY:
+            break
+
         # Checking geolocated accounts in each day
-        location_match = pkl.load(
-            open(
+        daily_tables.append(
+            pd.read_parquet(
                 os.path.join(
                     config["PATHS"]["ACCOUNTS_DATA_FOLDER"],
-                    day + "_account_location_match.pkl",
-                ),
-                "rb",
+                    day + "_account_location.parquet",
+                )
             )
         )
 
-        day = dt.strptime(day, "%Y-%m-%d")
-
-        if day > LAST_DAY:
-            break
-
-        for key in location_match:
-            account_location_match[key] = location_match[key]
-
-    pkl.dump(
-        account_location_match,
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"],
-                config["FILES"]["ACCOUNT_LOCATION"],
-            ),
-            "wb",
+    # Days are sorted, so keeping the last row of each account retains its last location
+    account_location = pd.concat(daily_tables, ignore_index=True)
+    account_location = account_location.drop_duplicates("account_id", keep="last")
+    account_location.to_parquet(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"],
+            config["FILES"]["ACCOUNT_LOCATION_TABLE"],
         ),
+        index=False,
     )
 
 
@@ -206,10 +435,13 @@ if __name__ == "__main__":
         args = parse_cl_args()
         config = parse_config_file(args.config_file)
 
+        print("Migrating legacy pickles (if any).")
+        migrate_legacy_pickles(config)
+
         print("Extracting locations from daily files.")
         account_tid_location_match(config)
 
-        print("Putting everything together in a unique dictionary.")
+        print("Putting everything together in a unique table.")
         build_global_location(config)
         exit(0)
 
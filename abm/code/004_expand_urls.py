@@ -1,65 +1,40 @@
 """
 Purpose: Expand shortened URLs. This script creates a different output file
-    for every input file it reads.
+    for every input file it reads. It then combines tweets, accounts, URLs and
+    their domains in a single fact table, which is the canonical input of the
+    following scripts.
 
 Input:
     - Mapping from URL to a list of tweet ids (which contained that URL), for each day
         - Form (dict): {URL : [tweet_id]}
+    - Table of the tweets shared by each account, for each day
+        - Columns: | account_id | tweet_id |
 
 Output:
     - Mapping from URL to expanded URL, for each day
         - Form (dict): {URL : URL_expanded}
         - Short URLs only
+    - A persistent cache (.sqlite) of all expansions, shared by all days
+    - Tweet -> URL -> domain fact table (.parquet) partitioned by day
+        - Columns: | day | tweet_id | account_id | url | expanded_url | domain |
 
 Authors:
     - Kaicheng Yang
     - Francesco Pierri
     - Matthew DeVerna
 """
-import concurrent.futures
 import glob
 import os
-import urlexpander
-import queue
-import requests
 import tldextract
+import urlexpander
 
 import pandas as pd
 import pickle as pkl
 from urllib.parse import urlparse
 
+from url_expansion import AsyncURLExpander, ExpansionCache, ExpansionLog
 from utils import parse_cl_args, parse_config_file
 
-HEADERS = {
-    "user-agent": "Mozilla/5.0 (compatible; HoaxyBot/1.0 +http://cnets.indiana.edu; truthy@indiana.edu)"
-}
-HTTP_TIMEOUT = 20
-
-
-def fetch_full_url(short_url):
-    """
-    Fetch the full URL of a short_url by sending an HTTP HEAD request.
-
-    Parameters:
-    ----------
-    short_url (str): Shortened URL to fetch the full URL of
-
-    Returns:
-    -------
-    str: Full URL of the shortened URL
-    """
-    try:
-        r = requests.head(
-            short_url, allow_redirects=True, headers=HEADERS, timeout=HTTP_TIMEOUT
-        )
-        base_url = r.url
-        if not base_url.endswith("/"):
-            base_url = base_url + "/"
-    except Exception as e:
-        print(e)
-        base_url = short_url
-    return base_url
-
 
 def extract_top_domain(url):
     """
@@ -82,9 +57,37 @@ def extract_top_domain(url):
 def expand_urls(config):
     """
     Expand all shortened URLs in various input files.
+
+    URLs are expanded concurrently with HEAD requests (see url_expansion.py). Those
+    that the HEAD request does not expand are retried with the urlexpander package.
+    Concurrency limits are set in the [URL_EXPANSION] section of the config file.
+
+    Expansions are read from and written to a persistent cache so that only short
+    URLs never seen on a previous day (or whose lookup failed more than
+    FAILED_TTL_DAYS ago) are sent to the network.
+
+    Results are streamed to an append-only log as they arrive, which is flushed to disk
+    every CHECKPOINT_EVERY URLs. If a day is interrupted, the URLs already in its log
+    are not expanded again. The final .pkl file is written once, at the end of the day.
     """
     print("Begin extracting urls...")
 
+    expansion_config = config["URL_EXPANSION"]
+    expander = AsyncURLExpander(
+        max_concurrency=expansion_config.getint("MAX_CONCURRENCY"),
+        max_per_host=expansion_config.getint("MAX_PER_HOST"),
+        max_redirects=expansion_config.getint("MAX_REDIRECTS"),
+        timeout=expansion_config.getint("HTTP_TIMEOUT"),
+        fallback=urlexpander.expand,
+    )
+    cache = ExpansionCache(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"],
+            config["FILES"]["URL_EXPANSION_CACHE"],
+        ),
+        failed_ttl_days=expansion_config.getfloat("FAILED_TTL_DAYS"),
+    )
+
     short_link_services = [
         "bit.ly",
         "dlvr.it",
@@ -167,36 +170,104 @@ def expand_urls(config):
 
         print("No. urls to expand: " + str(urls_to_expand.__len__()))
 
-        # Do main expansion
-        q = queue.Queue()
+        # Reuse expansions from previous days
+        cached, num_failed, urls_to_fetch = cache.lookup(urls_to_expand)
+        print(
+            f"Cached: {len(cached):,} | Recently failed: {num_failed:,} | "
+            f"To fetch: {len(urls_to_fetch):,}"
+        )
 
-        def expand_domain(short_url):
-            expanded_url = fetch_full_url(short_url)
-            top_domain = extract_top_domain(expanded_url)
-            q.put([short_url, expanded_url, top_domain])
+        # Resume from the log of an interrupted run, if present
+        log = ExpansionLog(
+            output_path.replace(".pkl", ".log.jsonl"),
+            checkpoint_every=expansion_config.getint("CHECKPOINT_EVERY"),
+        )
+        if log.done:
+            print(f"Resuming: {len(log.done):,} URLs already in the log")
+            urls_to_fetch = [url for url in urls_to_fetch if url not in log.done]
 
-        with concurrent.futures.ThreadPoolExecutor(max_workers=20) as executor:
-            executor.map(expand_domain, urls_to_expand)
+        # Do main expansion. Each outcome is appended to the log as it arrives
+        expander.expand(urls_to_fetch, on_result=log.append)
+        log.close()
 
-        df = pd.DataFrame(
-            list(q.queue), columns=["short_url", "expanded_url", "top_domain"]
-        )
+        # URLs that were not expanded, even by urlexpander, are excluded
+        fetched = [(old, new) for old, new in log.done.items() if new is not None]
+        cache.store(list(log.done), fetched)
 
-        # Check if the expanded url is the same as the original and, if so, use the
-        # urlexpander package to try and further expand it
         print("Updating links")
-        expanded_urls_dict = dict()
-        for ix, row in df.iterrows():
-            old = row["short_url"]
-            new = row["expanded_url"]
-            if old == new:
-                try:
-                    # try to further expand it with urlexpander
-                    new = urlexpander.expand(old)
-                except:
-                    continue
-            expanded_urls_dict[old] = new
-            pkl.dump(expanded_urls_dict, open(output_path, "wb"))
+        expanded_urls_dict = dict(cached)
+        expanded_urls_dict.update(fetched)
+        pkl.dump(expanded_urls_dict, open(output_path, "wb"))
+        log.remove()
+
+    cache.close()
+
+
+def build_url_facts(config):
+    """
+    Combine the daily URL, expanded URL and account files into a fact table with
+    one row per (tweet, URL) pair. Each day is saved as its own partition, i.e.,
+    URL_FACTS_FOLDER/day=YYYY-mm-dd/part-0.parquet, and days that already have a
+    partition are skipped.
+
+    Columns:
+    | day | tweet_id | account_id | url | expanded_url | domain |
+        - `expanded_url` is the expanded form of `url` if it was shortened, else `url`
+        - `domain` is the top-level domain of `expanded_url`
+        - `account_id` is missing if the tweet's account could not be matched
+    """
+    for file in sorted(
+        glob.glob(config["PATHS"]["URLS_DAILY_FOLDER"] + "/*_urls_expanded.pkl")
+    ):
+        day = os.path.basename(file).replace("_urls_expanded.pkl", "")
+        print(day)
+
+        output_path = os.path.join(
+            config["PATHS"]["URL_FACTS_FOLDER"], f"day={day}", "part-0.parquet"
+        )
+        if os.path.exists(output_path):
+            print("Already processed!")
+            continue
+
+        # Form (dict): {URL : [tweet_id]}
+        urls_tweet_match = pkl.load(open(file.replace("_expanded.pkl", ".pkl"), "rb"))
+        # Form (dict): {URL : URL_expanded}
+        urls_expanded_dict = pkl.load(open(file, "rb"))
+        # Columns: | account_id | tweet_id |
+        tweet_account = pd.read_parquet(
+            os.path.join(
+                config["PATHS"]["ACCOUNTS_DATA_FOLDER"], day + "_account_tweets.parquet"
+            )
+        )
+
+        facts = (
+            pd.Series(urls_tweet_match, name="tweet_id", dtype=object)
+            .rename_axis("url")
+            .explode()
+            .dropna()
+            .reset_index()
+        )
+        facts["tweet_id"] = facts["tweet_id"].astype("int64")
+
+        # Take the expanded version of shortened URLs
+        facts["expanded_url"] = facts["url"].map(urls_expanded_dict)
+        facts["expanded_url"] = facts["expanded_url"].fillna(facts["url"])
+
+        # Extract each distinct domain only once
+        unique_urls = facts["expanded_url"].unique()
+        domains = pd.Series(
+            [extract_top_domain(url) for url in unique_urls],
+            index=unique_urls,
+            dtype=object,
+        )
+        facts["domain"] = facts["expanded_url"].map(domains)
+
+        tweet_account = tweet_account.drop_duplicates("tweet_id")
+        facts = facts.merge(tweet_account, on="tweet_id", how="left")
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        facts = facts[["tweet_id", "account_id", "url", "expanded_url", "domain"]]
+        facts.astype({"account_id": "Int64"}).to_parquet(output_path, index=False)
 
 
 if __name__ == "__main__":
@@ -207,6 +278,9 @@ if __name__ == "__main__":
 
         print("Expanding URLs.")
         expand_urls(config)
+
+        print("Building the tweet -> URL -> domain fact table.")
+        build_url_facts(config)
         exit(0)
     except:
         print("Something's wrong.")
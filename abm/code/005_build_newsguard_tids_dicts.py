@@ -4,10 +4,8 @@ Purpose: Create dictionaries that contain - for each NewsGuard
     See "Outputs" below for more details on what is created.
 
 Inputs:
-    - One file for each day which is a dictionary URL to tweet ids
-        - Form (dict): {URL : [tweet_id]}
-    - One file for each day which is a dictionary URL to its expanded form
-        - Form (dict): {URL : URL_expanded}
+    - Tweet -> URL -> domain fact table created by 004_expand_urls.py
+        - Only the | tweet_id | domain | columns are read, one day at a time
 
 Outputs:
     - One file for each day which is a dictionary of nested dictionaries
@@ -23,38 +21,78 @@ Authors:
 - Francesco Pierri
 - Matthew DeVerna
 """
+import concurrent.futures
 import os
-import tldextract
 
-import glob as glob
 import pandas as pd
 import pickle as pkl
-from collections import defaultdict
 
-from utils import parse_cl_args, parse_config_file
+from utils import (
+    list_url_fact_days,
+    parse_cl_args,
+    parse_config_file,
+    read_url_facts,
+)
 
 
-def extract_top_domain(url):
+def load_newsguard_scores(config):
     """
-    Extract the top-level domain of a given URL
+    Load the NewsGuard table as a domain-indexed series of credibility scores.
 
     Parameters:
     ----------
-    url (str): URL to extract the top-level domain from
+    - config (dict): A dictionary with config information about paths and filenames.
 
     Returns:
-    -------
-    str: Top-level domain of the URL guaranteed to be lowercase
+    ----------
+    pd.Series: credibility scores (0 to 100) indexed by domain
     """
-    extraction_result = tldextract.extract(url)
-    domain = extraction_result.domain
-    suffix = extraction_result.suffix
-    return f"{domain}.{suffix}".lower()
+    newsguard_df = pd.read_csv(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"],
+            config["FILES"]["NEWSGUARD_FILE"],
+        )
+    )
+    # Keep the first score of each domain, like a lookup in the full table would
+    newsguard_df = newsguard_df.drop_duplicates("Domain")
+    return newsguard_df.set_index("Domain")["Score"]
+
+
+def match_newsguard_day(config, day, newsguard_scores, output_path):
+    """
+    Match the NewsGuard domains to the tweets of a single day and save the result.
+
+    Parameters:
+    ----------
+    - config (dict): A dictionary with config information about paths and filenames.
+    - day (str): The day to process (YYYY-mm-dd)
+    - newsguard_scores (pd.Series): Output of `load_newsguard_scores`
+    - output_path (str): Where to save the daily .pkl file
+    """
+    print("Processing: " + day)
+
+    # Daily tweet ids and the top level domain of the (expanded) URL they shared
+    facts = read_url_facts(config, ["tweet_id", "domain"], day=day)
+
+    # Only keep domains within the News Guard data set, attaching their score
+    facts = facts.merge(
+        newsguard_scores.rename("ng_score"), left_on="domain", right_index=True
+    )
+    facts = facts.astype({"tweet_id": str})
+    domain_tids = facts.groupby("domain").agg(
+        tids=("tweet_id", set), ng_score=("ng_score", "first")
+    )
+
+    # Build the final output dictionary and save the .pkl file
+    ng_match = domain_tids.to_dict(orient="index")
+    pkl.dump(ng_match, open(output_path, "wb"))
 
 
 def extract_newsguard_score(config):
     """
     Function to match Newsguard domains to URLs shared with tweets on a daily basis.
+    All unprocessed days are handled in one run, in parallel if more than one worker
+    is set by NUM_WORKERS in the [VARIABLES] section of the config file.
 
     Parameters:
     ----------
@@ -67,70 +105,30 @@ def extract_newsguard_score(config):
         --> { 'domain' : { 'tweet_ids' : set(tweet_ids), 'newsguard_score' : a credibility score from 0 to 100}
     """
     ## Reading list of low- and high-credibility websites
-    newsguard_df = pd.read_csv(
-        os.path.join(
-            config["PATHS"]["INTERMEDIATE_FILES"],
-            config["FILES"]["NEWSGUARD_FILE"],
-        )
-    )
-    newsguard_websites = set(newsguard_df["Domain"])
-
-    # iterate over all daily urls files
-    daily_urls_files = sorted(
-        glob.glob(config["PATHS"]["URLS_DAILY_FOLDER"] + "/*_urls.pkl")
-    )
-    for file in daily_urls_files:
-        # Parse the date from the filename
-        day = os.path.basename(file).replace("_urls.pkl", "")
-        print("Processing: " + day)
+    newsguard_scores = load_newsguard_scores(config)
 
+    # Collect all days of the fact table that have not been processed yet
+    jobs = []
+    for day in list_url_fact_days(config):
         output_path = os.path.join(
             config["PATHS"]["URLS_DAILY_FOLDER"], day + "_newsguard_match.pkl"
         )
         if os.path.exists(output_path):
-            print("Already processed!")
+            print(f"{day} already processed!")
             continue
-
-        # Load daily URL to tweet id mapping
-        #   Form (dict): {URL : [tweet_id]}
-        urls_tweet_match = pkl.load(open(file, "rb"))
-
-        # Load URL to expanded URL mapping (both strings)
-        #   Form (dict): {URL : URL_expanded}
-        urls_expanded_dict = pkl.load(
-            open(file.replace("_urls.pkl", "_urls_expanded.pkl"), "rb")
-        )
-
-        domain_tids = defaultdict(list)
-
-        # Iterate through all urls for a given day
-        for u in urls_tweet_match:
-            # Grab all tweet ids that sent that url
-            tids = urls_tweet_match[u]
-
-            # If that urls is in the `expanded_dict` then
-            # we have an expanded version of that URL, so we take
-            # that one
-            if u in urls_expanded_dict:
-                full_url = urls_expanded_dict[u]
-            else:
-                full_url = u
-
-            # Extract the top level domain and add the tweet_ids that
-            # were shared for that domain on this day but only if it
-            # is within the New Guard data set
-            domain = extract_top_domain(full_url)
-            if domain in newsguard_websites:
-                domain_tids[domain] += tids
-
-        # Build the final output dictionary and save the .pkl file
-        ng_match = dict()
-        for domain in domain_tids:
-            tids = set(domain_tids[domain])
-            ng_score = newsguard_df[newsguard_df["Domain"] == domain]["Score"].values[0]
-            ng_match[domain] = {"tids": tids, "ng_score": ng_score}
-
-        pkl.dump(ng_match, open(output_path, "wb"))
+        jobs.append((config, day, newsguard_scores, output_path))
+
+    num_workers = config.getint("VARIABLES", "NUM_WORKERS", fallback=1)
+    if num_workers <= 1:
+        for job in jobs:
+            match_newsguard_day(*job)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = [executor.submit(match_newsguard_day, *job) for job in jobs]
+        for future in concurrent.futures.as_completed(futures):
+            # Raise errors from the workers
+            future.result()
 
 
 if __name__ == "__main__":
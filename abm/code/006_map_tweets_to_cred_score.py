@@ -3,17 +3,16 @@ Purpose: Mapping tweets, users, URLs and credibility score according to Newsguar
 
 Input:
     - Daily files for:
-        (dict) URL : list of tweet ids
-        (dict) URL : URL_expanded
-        (dict) user id : list of tweet ids
-    - Global file with:
-        (dict) user id : location
+        (dict) domain : {"tids": set of tweet ids, "ng_score": score}
+        (table) user id | tweet id
+    - Global table with:
+        user id | location | country | state | county | city | carmen_id
 
 Output:
     - Global mappings:
-       (dict) tweet id: {"domain": domain, "score": score} (created with map_tweet_score)
-       (dict) tweet id : URL (created with map_tweet_url)
-       (dict) account id : list of tweet ids shared (created with map_account_tweet)
+       (map) tweet id : domain, score (created with map_tweet_score)
+       (index) account id : tweet ids shared (created with map_account_tweet)
+       - All are memory-mapped, see tweet_maps.py
 
 Authors:
     - Francesco Pierri
@@ -22,14 +21,17 @@ Authors:
 import os
 
 import glob as glob
+import numpy as np
+import pandas as pd
 import pickle as pkl
 
-from collections import defaultdict
 from datetime import datetime as dt
-from utils import parse_cl_args, parse_config_file
-
-# This is needed for the eval(location) line to work below
-from carmen.location import Location
+from tweet_maps import save_account_tweets, save_tweet_map
+from utils import (
+    load_us_county_accounts,
+    parse_cl_args,
+    parse_config_file,
+)
 
 LAST_DAY = "2021-09-30"
 
@@ -38,162 +40,90 @@ def map_tweet_score(config):
     """
     A function to map tweets to NG score of their URL (if present).
 
-    Output dictionary:
-    {
-        tid1: {"domain": domain, "score": score},
-        tid2: {"domain": domain, "score": score},
-        ...
-    }
+    Output map (see tweet_maps.py), with one row per tweet:
+    | tweet_id | domain | score |
     """
 
-    tweet_source_score = dict()
+    tweet_ids = []
+    domain_codes = []
+    scores = []
+    domains = dict()
     for file in sorted(
         glob.glob(config["PATHS"]["URLS_DAILY_FOLDER"] + "/*newsguard*")
     ):
         data = pkl.load(open(file, "rb"))
         for domain in data:
-            for tid in data[domain]["tids"]:
-                tweet_source_score[tid] = {
-                    "domain": domain,
-                    "score": data[domain]["ng_score"],
-                }
-
-    output_fp = os.path.join(
-        config["PATHS"]["INTERMEDIATE_FILES"],
-        config["FILES"]["TWEET_CREDIBILITY_SCORE"],
-    )
-    pkl.dump(
-        tweet_source_score,
-        open(
-            output_fp,
-            "wb",
-        ),
-    )
-
-
-def map_tweet_url(config):
-    """
-    A function to map tweets to URLs shared.
-    """
-
-    last_day = dt.strptime(LAST_DAY, "%Y-%m-%d")
-
-    tweet_url = dict()
-    for file in sorted(glob.glob(config["PATHS"]["URLS_DAILY_FOLDER"] + "/*_urls.pkl")):
-        day = os.path.basename(file).replace("_urls.pkl", "")
-        day = dt.strptime(day, "%Y-%m-%d")
-
-        if day > last_day:
-            break
-
-        # Load all URLs for that day
-        urls_tweet_match = pkl.load(open(file, "rb"))
-
-        # Need to get expanded domains, if present
-        urls_expanded_dict = pkl.load(
-            open(file.replace("_urls.pkl", "_urls_expanded.pkl"), "rb")
-        )
-
-        # Add the tid -> URL mapping, use full URL if shortened
-        for u, tids in urls_tweet_match.items():
-            # If the URL is shortened, take expanded version
-            if u in urls_expanded_dict:
-                full_url = urls_expanded_dict[u]
-            else:
-                full_url = u
-            for t in tids:
-                tweet_url[t] = full_url
-
-    output_fp = os.path.join(
-        config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["TWEET_URL"]
-    )
-    pkl.dump(
-        tweet_url,
-        open(
-            output_fp,
-            "wb",
+            tids = np.fromiter(data[domain]["tids"], dtype=np.int64)
+            code = domains.setdefault(domain, len(domains))
+            tweet_ids.append(tids)
+            domain_codes.append(np.full(len(tids), code, dtype=np.int32))
+            scores.append(np.full(len(tids), data[domain]["ng_score"], dtype=float))
+
+    # Later days overwrite earlier ones, like updating a dictionary would
+    save_tweet_map(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"],
+            config["FILES"]["TWEET_CREDIBILITY_SCORE"],
         ),
+        np.concatenate(tweet_ids) if tweet_ids else np.array([], dtype=np.int64),
+        {
+            "domain": pd.Categorical.from_codes(
+                np.concatenate(domain_codes) if domain_codes else [],
+                categories=list(domains),
+            ),
+            "score": np.concatenate(scores) if scores else np.array([]),
+        },
     )
 
 
 def map_account_tweet(config):
     """
     A function to map accounts to tweet ids shared
-    """
-    account_tweet = defaultdict(list)
 
+    Only geolocated accounts are kept. The daily | account_id | tweet_id | tables are
+    streamed one day at a time and the result is saved as a CSR-style index (see
+    tweet_maps.py) in which the tweets of each account are contiguous.
+    """
     last_day = dt.strptime(LAST_DAY, "%Y-%m-%d")
 
     # Checking geolocated accounts
-    location_match = pkl.load(
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"],
-                config["FILES"]["ACCOUNT_LOCATION"],
-            ),
-            "rb",
-        )
-    )
-    account_county = dict()
-    for key in location_match:
-        acc = location_match[key]
-        if not acc["location"]:  # no location, skip
-            continue
-        key = str(key)  # to ensure consistency
-        location = acc["carmen_location"]
-        if location == "No match!":
-            continue
-        # check if it's U.S.
-        location = eval(location)  # use Carmen Location object
-        if location.country == "United States" and location.state and location.county:
-            county = location.county
-            state = location.state
-            account_county[key] = [county, state]
+    account_county = load_us_county_accounts(config)
+    us_account_ids = account_county.index.astype("int64")
 
     print("Done building `account_county`.")
 
-    ## Loading daily files with "account <-> tweet" dictionary
+    ## Loading daily files with "account <-> tweet" tables
+    account_ids = []
+    tweet_ids = []
     for file in sorted(
-        glob.glob(os.path.join(config["PATHS"]["URLS_DAILY_FOLDER"], "*_urls.pkl"))
+        glob.glob(
+            os.path.join(
+                config["PATHS"]["ACCOUNTS_DATA_FOLDER"], "*_account_tweets.parquet"
+            )
+        )
     ):
         print(file)
-        day = os.path.basename(file).replace("_urls.pkl", "")
+        day = os.path.basename(file).replace("_account_tweets.parquet", "")
 
         # Convert to dt for date check
         day = dt.strptime(day, "%Y-%m-%d")
         if day > last_day:
             break
 
-        # Convert back for file name building
-        day = os.path.basename(file).replace("_urls.pkl", "")
-
-        daily_account_tweet = pkl.load(
-            open(
-                os.path.join(
-                    config["PATHS"]["ACCOUNTS_DATA_FOLDER"],
-                    str(day) + "_account_tids_dict.pkl",
-                ),
-                "rb",
-            )
-        )
-
-        # a bit unnecessary but to be 100% sure we are working with strings here
-        for k in list(daily_account_tweet.keys()):
-            daily_account_tweet[str(k)] = daily_account_tweet[k]
-
         # only geolocated accounts
-        for a in account_county:
-            if a in daily_account_tweet:
-                account_tweet[a] += daily_account_tweet[a]
-
-    pkl.dump(
-        account_tweet,
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TWEETS"]
-            ),
-            "wb",
+        daily_account_tweet = pd.read_parquet(file, columns=["account_id", "tweet_id"])
+        daily_account_tweet = daily_account_tweet[
+            daily_account_tweet["account_id"].isin(us_account_ids)
+        ]
+        account_ids.append(daily_account_tweet["account_id"].to_numpy())
+        tweet_ids.append(daily_account_tweet["tweet_id"].to_numpy())
+
+    save_account_tweets(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TWEETS"]
         ),
+        np.concatenate(account_ids) if account_ids else [],
+        np.concatenate(tweet_ids) if tweet_ids else [],
     )
 
 
@@ -206,9 +136,6 @@ if __name__ == "__main__":
         print("Map tweets to NG score.")
         map_tweet_score(config)
 
-        print("Map tweets to URLs.")
-        map_tweet_url(config)
-
         print("Map tweets to accounts.")
         map_account_tweet(config)
     except Exception as e:
@@ -24,15 +24,12 @@ import os
 
 import datetime as datetime
 import glob as glob
-import pickle as pkl
 import pandas as pd
 import networkx as nx
 
 from datetime import datetime as dt
-from utils import parse_cl_args, parse_config_file
-
-# This is needed for the eval(location) line to work below
-from carmen.location import Location
+from tweet_maps import TweetMap
+from utils import load_us_county_accounts, parse_cl_args, parse_config_file
 
 LAST_DAY = "2021-09-30"
 
@@ -48,44 +45,15 @@ def build_global_edges(config):
     last_day = dt.strptime(LAST_DAY, "%Y-%m-%d")
 
     # Newsguard score for each tweet containing URLs
-    tweet_source_score = pkl.load(
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"],
-                config["FILES"]["TWEET_CREDIBILITY_SCORE"],
-            ),
-            "rb",
+    tweet_source_score = TweetMap(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"],
+            config["FILES"]["TWEET_CREDIBILITY_SCORE"],
         )
     )
 
     # Checking geolocated accounts
-    location_match = pkl.load(
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"],
-                config["FILES"]["ACCOUNT_LOCATION"],
-            ),
-            "rb",
-        )
-    )
-    account_county = dict()
-    for key in location_match:
-        acc = location_match[key]
-
-        if not acc["location"]:  # no location, skip
-            continue
-
-        key = str(key)  # to ensure consistency
-
-        location = acc["carmen_location"]
-        if location == "No match!":
-            continue
-        # check if it's U.S.
-        location = eval(location)  # use Carmen Location object
-        if location.country == "United States" and location.state and location.county:
-            county = location.county
-            state = location.state
-            account_county[key] = [county, state]
+    account_county = load_us_county_accounts(config)
 
     for file in sorted(
         glob.glob(config["PATHS"]["RETWEET_NETWORK_FOLDER"] + "/*edgelist*")
@@ -109,20 +77,14 @@ def build_global_edges(config):
 
         ## Filtering US-counties accounts
         df = df[
-            (df["retweeting_user_id"].isin(account_county))
-            & (df["retweeted_user_id"].isin(account_county))
+            (df["retweeting_user_id"].isin(account_county.index))
+            & (df["retweeted_user_id"].isin(account_county.index))
         ]
 
         ## Adding domain and score for Newsguard sources link
-        df["tweet_id"] = df["tweet_id"].astype(str)
-        df["domain"] = [
-            tweet_source_score[tid]["domain"] if tid in tweet_source_score else None
-            for tid in df["tweet_id"]
-        ]
-        df["score"] = [
-            tweet_source_score[tid]["score"] if tid in tweet_source_score else -1
-            for tid in df["tweet_id"]
-        ]
+        matches = tweet_source_score.lookup(df["tweet_id"].to_numpy())
+        df["domain"] = matches["domain"].to_numpy()
+        df["score"] = matches["score"].where(matches["found"], -1).to_numpy()
 
         edges.append(df)
     edges = pd.concat(edges)
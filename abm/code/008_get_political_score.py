@@ -5,9 +5,9 @@ Purpose:
 
 Inputs:
     - Mapping from account to tweet IDs
-        - Form (dict) : {account_id : [tweet_ids]}
-    - Mapping from tweets to (expanded) URLs
-        - Form (dict) : {tweet_id : {URL}}
+        - Form (index) : account_id : tweet_ids (see tweet_maps.py)
+    - Tweet -> URL -> domain fact table
+        - Only the | tweet_id | domain | columns are read
     - Ideology estimation scores for domains
         - Form (pd.DataFrame) :
             - Rows = domains
@@ -15,110 +15,127 @@ Inputs:
             - Note: est. ideology scores range from -1 to +1
 
 Outputs:
-    One .pkl file of a dictionary that has the following form...
+    - One .pkl file of a dictionary that has the following form...
         --> {user_id : [list of scores between -1 and +1]}
     each score represents the est. political ideology of a single domains
     shared by `user_id`
+    - One .parquet table with the mean, number and variance of the scores
+    of each account
 
 Author: Francesco Pierri & Matthew DeVerna
 """
 import os
-import tldextract
 
 import pickle as pkl
+import numpy as np
 import pandas as pd
 
 from collections import defaultdict
-from utils import parse_cl_args, parse_config_file
+from tweet_maps import AccountTweets
+from utils import parse_cl_args, parse_config_file, read_url_facts
 
-
-def extract_top_domain(url):
-    """
-    Extract the top-level domain of a given URL
-
-    Parameters:
-    ----------
-    url (str): URL to extract the top-level domain from
-
-    Returns:
-    -------
-    str: Top-level domain of the URL guaranteed to be lowercase
-    """
-    extraction_result = tldextract.extract(url)
-    domain = extraction_result.domain
-    suffix = extraction_result.suffix
-    return f"{domain}.{suffix}".lower()
+LAST_DAY = "2021-09-30"
 
 
 def get_account_political(config):
     """
     Assign political scores to each URL shared by all geolocated accounts.
 
+    The account -> tweet -> domain -> score chain is resolved with joins over
+    int64 keyed tables and the per-account statistics are computed in a single
+    group-by, rather than with dictionary lookups for each tweet.
+
     Parameters:
     ----------
     - config : contents of the project configuration file
 
     Output:
     ----------
-    A dictionary of the following form...
+    1) A dictionary of the following form...
         --> {user_id : [list of scores between -1 and +1]}
     where each value represents the estimated ideology of the domain
     that `user_id` shared.
+    2) A table (.parquet) with one row per account with at least one score
+        - Columns: | account_id | political_mean | political_count | political_var |
     """
-    account_political = defaultdict(list)
-
     # Load account to tweet mapping
-    #   Form (dict) : {user_id : [tweetid_1, tweetid_2, ..., tweetid_n]}
-    #   Note: This dictionary only includes geo-located accounts
-    account_tweet = pkl.load(
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TWEETS"]
-            ),
-            "rb",
+    #   Form (index) : user_id : [tweetid_1, tweetid_2, ..., tweetid_n]
+    #   Note: This index only includes geo-located accounts
+    account_tweet = AccountTweets(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TWEETS"]
         )
     )
+    account_tweet = pd.DataFrame(
+        {
+            "account_id": np.repeat(
+                np.asarray(account_tweet.account_ids), account_tweet.num_tweets()
+            ),
+            "tweet_id": np.asarray(account_tweet.tweet_ids),
+        }
+    )
 
-    # Load tweet to URL mapping
-    #   Form (dict) : {tweet_id : {URL}}
-    tweet_url_mapping = pkl.load(
-        open(
+    # Load political estimates of domains.
+    #   Form (pd.Series) : website -> est. political score
+    #     - est. political scores range from -1 to +1
+    domain_political = (
+        pd.read_csv(
             os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["TWEET_URL"]
+                config["PATHS"]["INTERMEDIATE_FILES"],
+                config["FILES"]["URL_POLITICAL_SCORE"],
             ),
-            "rb",
+            usecols=["domain", "score"],
         )
+        .drop_duplicates("domain", keep="last")
+        .set_index("domain")["score"]
     )
 
-    # Load political estimates of domains. Will create the below form
-    # from the loaded .csv file
-    #   Form (dict) : {website : est. political score}
-    #     - est. political scores range from -1 to +1
-    domain_political = pd.read_csv(
+    # Load tweet to (expanded) URL domain mapping and convert it to a
+    # | tweet_id | score | table. Only the last domain of each tweet is used.
+    tweet_political = read_url_facts(
+        config, ["tweet_id", "domain"], last_day=LAST_DAY
+    ).drop_duplicates("tweet_id", keep="last")
+    tweet_political = pd.DataFrame(
+        {
+            "tweet_id": tweet_political["tweet_id"].to_numpy(dtype=np.int64),
+            "score": tweet_political["domain"].map(domain_political).to_numpy(),
+        }
+    ).dropna(subset=["score"])
+
+    # Keep the tweets with an ideology score and sort them by account so that
+    # each account's scores are contiguous
+    account_scores = account_tweet.merge(tweet_political, on="tweet_id", how="inner")
+    account_scores = account_scores.sort_values("account_id", kind="stable")
+
+    grouped = account_scores.groupby("account_id", sort=True)["score"]
+    account_summary = pd.DataFrame(
+        {
+            "political_mean": grouped.mean(),
+            "political_count": grouped.size(),
+            "political_var": grouped.var(ddof=0),
+        }
+    ).reset_index()
+
+    account_summary.to_parquet(
         os.path.join(
             config["PATHS"]["INTERMEDIATE_FILES"],
-            config["FILES"]["URL_POLITICAL_SCORE"],
-        )
+            config["FILES"]["ACCOUNT_POLITICAL_TABLE"],
+        ),
+        index=False,
     )
 
-    # Convert dataframe to dictionary mapping domains to their ideology scores
-    domain_political = {
-        row["domain"]: row["score"] for ix, row in domain_political.iterrows()
-    }
-
-    """
-    The below loop checks if we have an ideology score for a domain shared
-    by a user and, if we do, it adds that ideology score to their list within
-    the `account_political` dictionary.
-    """
-    for a in account_tweet:
-        for tid in account_tweet[a]:
-            if tid in tweet_url_mapping:
-                url = tweet_url_mapping[tid]
-                domain = extract_top_domain(url)
-                if domain in domain_political:
-                    score = domain_political[domain]
-                    account_political[a].append(score)
+    # Split the sorted scores into one array per account
+    scores = np.split(
+        account_scores["score"].to_numpy(),
+        np.cumsum(account_summary["political_count"].to_numpy())[:-1],
+    )
+    account_political = defaultdict(
+        list,
+        zip(
+            account_summary["account_id"].astype(str),
+            (account_score.tolist() for account_score in scores),
+        ),
+    )
 
     pkl.dump(
         account_political,
@@ -4,32 +4,62 @@ Purpose:
         and percentage of misinformation shared by individual user.
 
 Input:
-    - Carmen location data dictionary
-    - Account tweet_ids dictionary
-    - Tweet URL credibility rating dictionary
-    - Political estimates of users
+    - Carmen location data table
+    - Account -> tweet_ids index (see tweet_maps.py)
+    - Tweet URL credibility rating map (see tweet_maps.py)
+    - Political estimates of users (table created by 008_get_political_score.py)
 
 Output:
-    - A single .csv with the following information.
+    - A single .parquet table (and, optionally, a .csv copy) with the following
+    information.
         - Location (As identified by the Carmen package)
         - Estimated political ideology score
-        - Percent of misinformation shared
+        - Fraction of misinformation shared (one column per NewsGuard threshold)
 
 Authors:
     - Francesco Pierri
     - Matthew DeVerna
 """
 import os
-import csv
 
-import pickle as pkl
 import numpy as np
+import pandas as pd
 
-from collections import Counter
-from utils import parse_cl_args, parse_config_file
+from tweet_maps import AccountTweets, TweetMap
+from utils import load_us_county_accounts, parse_cl_args, parse_config_file
 
-# This is needed for the eval(location) line to work below
-from carmen.location import Location
+NG_THRESHOLDS = [10, 20, 30, 40, 50, 60]
+
+
+def count_below_thresholds(account_positions, scores, num_accounts, thresholds):
+    """
+    Count, for each account, the number of scores below each threshold.
+
+    Parameters:
+    ----------
+    - account_positions (np.ndarray) : position (0, ..., num_accounts - 1) of the
+        account of each score
+    - scores (np.ndarray) : credibility scores. NaN scores are never counted
+    - num_accounts (int) : number of accounts
+    - thresholds (list) : sorted thresholds
+
+    Returns:
+    ----------
+    - counts (np.ndarray) : (num_accounts, len(thresholds)) array, where
+        counts[i, k] is the number of scores of account i that are < thresholds[k]
+
+    Notes:
+    ----------
+    Each score is binned once by the number of thresholds it is >= to, so that
+    score < thresholds[k] <==> bin <= k. All thresholds are then counted with a
+    single histogram and a cumulative sum, rather than once per threshold.
+    """
+    num_bins = len(thresholds) + 1
+    bins = np.searchsorted(thresholds, scores, side="right")
+    histogram = np.bincount(
+        account_positions * num_bins + bins, minlength=num_accounts * num_bins
+    ).reshape(num_accounts, num_bins)
+    return np.cumsum(histogram[:, :-1], axis=1)
 
 
 def get_account_table(config):
@@ -37,141 +67,88 @@ def get_account_table(config):
     Create an account-specific dataframe with location, political score and % misinformation
     """
 
-    # Load {User:Location} dictionary
+    # Load | county | state | for accounts located in U.S. counties
     #   Locations found with Carmen package
-    location_match = pkl.load(
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"],
-                config["FILES"]["ACCOUNT_LOCATION"],
-            ),
-            "rb",
-        )
-    )
-
-    account_county = dict()
-    for key in location_match:
-        acc_obj = location_match[key]
-
-        if not acc_obj["location"]:  # no location, skip
-            continue
-
-        acc_key = str(key)  # to ensure consistency with nodes and account ids
-
-        location = acc_obj["carmen_location"]
-        if location == "No match!":
-            continue
-        # check if it's U.S.
-        location = eval(location)  # use Carmen Location object
-        if location.country == "United States" and location.state and location.county:
-            county = location.county
-            state = location.state
-            account_county[acc_key] = [county, state]
+    account_county = load_us_county_accounts(config)
+    account_county.index = account_county.index.astype("int64")
 
     print("Loaded locations.")
 
-    account_tweet = pkl.load(
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TWEETS"]
-            ),
-            "rb",
+    account_tweet = AccountTweets(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TWEETS"]
         )
     )
     print("Loaded account->tweet mapping.")
 
     # credibility
-    tweet_source_score = pkl.load(
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"],
-                config["FILES"]["TWEET_CREDIBILITY_SCORE"],
-            ),
-            "rb",
+    tweet_source_score = TweetMap(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"],
+            config["FILES"]["TWEET_CREDIBILITY_SCORE"],
         )
     )
     print("Loaded tweet->credibility mapping.")
 
     # political
-    account_political = pkl.load(
-        open(
-            os.path.join(
-                config["PATHS"]["INTERMEDIATE_FILES"],
-                config["FILES"]["ACCOUNT_POLITICAL"],
-            ),
-            "rb",
-        )
-    )
+    account_political = pd.read_parquet(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"],
+            config["FILES"]["ACCOUNT_POLITICAL_TABLE"],
+        ),
+        columns=["account_id", "political_mean"],
+    ).set_index("account_id")["political_mean"]
     print("Loaded account->political score mapping.")
 
-    ng_thresholds = [10, 20, 30, 40, 50, 60]
+    ### Determine the fraction of tweets shared that       ###
+    ### are low-credibility, given different NG thresholds ###
+    # ---------------------------------------------------- ###
+
+    # Look up the scores of all tweets at once.
+    # Tweets with no credibility score are NaN and never counted.
+    account_ids = np.asarray(account_tweet.account_ids)
+    num_tweets = account_tweet.num_tweets()
+    scores = tweet_source_score.lookup(np.asarray(account_tweet.tweet_ids), ["score"])[
+        "score"
+    ].to_numpy()
+    misinfo_no_tweets = count_below_thresholds(
+        np.repeat(np.arange(len(account_ids)), num_tweets),
+        scores,
+        len(account_ids),
+        NG_THRESHOLDS,
+    )
+    misinfo_fraction = misinfo_no_tweets / num_tweets[:, None]
+
+    ### Build the table ###
+    # ----------------- ###
+    table = pd.DataFrame({"account_id": account_ids})
+    table["state"] = account_county["state"].reindex(account_ids).to_numpy()
+    table["county"] = account_county["county"].reindex(account_ids).to_numpy()
+
+    # If the account has not shared at least one URL with estimated political
+    # score, the score is NaN
+    table["political_score"] = account_political.reindex(account_ids).to_numpy()
+    for k, threshold in enumerate(NG_THRESHOLDS):
+        table["NG < " + str(threshold)] = misinfo_fraction[:, k]
+
+    # If no location, we skip
+    table = table[table["county"].notna()].astype(
+        {"account_id": "int64", "state": "string", "county": "string"}
+    )
 
-    ## Manually writing .csv file for the table
-    filepath = os.path.join(
-        config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TABLE"]
+    table.to_parquet(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TABLE"]
+        ),
+        index=False,
     )
-    with open(filepath, "w", newline="") as csvfile:
-        # Construct the header/columns and write them
-        fieldnames = ["account_id", "state", "county", "political_score"]
-        fieldnames += ["NG < " + str(threshold) for threshold in ng_thresholds]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=",")
-        writer.writeheader()
-
-        for account_id in account_tweet:
-            ### Determine account's political score ###
-            # ------------------------------------- ###
-
-            # If no location, we skip
-            if account_id not in account_county:
-                continue
-            # Must have at shared at least one URL with estimated political score
-            if account_political[account_id]:
-                political_score = np.mean(account_political[account_id])
-            # If not, score is NaN
-            else:
-                political_score = np.NaN
-
-            ### Determine the percentage of tweets shared that     ###
-            ### are low-credibility, given different NG thresholds ###
-            # ---------------------------------------------------- ###
-            misinfo_fraction = dict()
-            misinfo_no_tweets = Counter()
-
-            # Iterate through all tweets sent by the account
-            for tid in account_tweet[account_id]:
-                if tid in tweet_source_score:
-                    score = tweet_source_score[tid]["score"]
-
-                    # Skip tweets with no credibility score
-                    if not np.isfinite(tweet_source_score[tid]["score"]):
-                        continue
-
-                    # Count the number of tweets for each NG threshold
-                    for ng_threshold in ng_thresholds:
-                        if score < ng_threshold:
-                            misinfo_no_tweets[ng_threshold] += 1
-
-            # Calculate the percentage of low-cred tweets, relative to all tweets
-            # sent by the account, for each NG threshold
-            num_tweets = len(account_tweet[account_id])
-            for ng_threshold in ng_thresholds:
-                misinfo_fraction[ng_threshold] = (
-                    misinfo_no_tweets[ng_threshold] / num_tweets
-                )
-
-            ### Write a single row to the .csv file ###
-            # ------------------------------------- ###
-
-            # We are using the csv.DictWriter which takes dictionaries as input.
-
-            data = dict()
-            data["account_id"] = account_id
-            data["county"] = account_county[account_id][0]
-            data["state"] = account_county[account_id][1]
-            data["political_score"] = political_score
-            for threshold in misinfo_fraction:
-                data["NG < " + str(threshold)] = misinfo_fraction[threshold]
-            writer.writerow(data)
+
+    # Optional .csv export
+    csv_file = config["FILES"].get("ACCOUNT_TABLE_CSV")
+    if csv_file:
+        table.to_csv(
+            os.path.join(config["PATHS"]["INTERMEDIATE_FILES"], csv_file), index=False
+        )
 
 
 if __name__ == "__main__":
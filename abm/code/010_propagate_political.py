@@ -133,11 +133,11 @@ def propagate_political(config):
                 loop_flag = 0
                 user_count += 1
 
-    # Load .csv that contains information for all users
+    # Load table that contains information for all users
     #   Form:
     #   - Each rows represents an individual user_id
     #   - Columns include details like ideological estimate
-    pre_df = pd.read_csv(
+    pre_df = pd.read_parquet(
         os.path.join(
             config["PATHS"]["INTERMEDIATE_FILES"], config["FILES"]["ACCOUNT_TABLE"]
         )
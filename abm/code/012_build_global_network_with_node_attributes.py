@@ -1,12 +1,13 @@
 """
-Purpose: Create a weighted directed retweeting graph in .gexf format with node-level attributes
+Purpose: Create a weighted directed retweeting graph with node-level attributes
 
 Input:
     - Global retweeting graph
     - Table of propagated account information
 
 Output:
-    - A single .gexf with attributes at the node level (county, political score, misinformation)
+    - A single pickled graph (see utils.save_graph) with attributes at the node level
+        (county, political score, misinformation)
 
 Authors:
     - Francesco Pierri
@@ -15,10 +16,9 @@ Authors:
 import os
 
 import networkx as nx
-import numpy as np
 import pandas as pd
 
-from utils import parse_cl_args, parse_config_file
+from utils import parse_cl_args, parse_config_file, save_graph
 
 # NG attributes represent the % of shared tweets that
 # are low credibility given different NG thresholds.
@@ -55,21 +55,20 @@ def build_global_graph_attributed(config):
         )
     )
 
-    # Update the graph with attributes
-    for ix, row in table.iterrows():
-        for key in ATTRIBUTES:
-            account_id = str(row["account_id"])
-            if account_id not in g.nodes:
-                continue
-            g.nodes[account_id][key] = row[key]
+    # Align the table to the graph's nodes (the last row of an account wins)
+    table.index = table["account_id"].astype(str)
+    table = table[~table.index.duplicated(keep="last")]
+    table = table[table.index.isin(g.nodes)]
 
-    # Remove nodes without political score
-    for n in list(g.nodes):
-        if np.isnan(g.nodes[n]["political_score"]):
-            g.remove_node(n)
+    # Update the graph with attributes, one column at a time
+    for key in ATTRIBUTES:
+        nx.set_node_attributes(g, dict(zip(table.index, table[key].tolist())), key)
+
+    # Keep only nodes with a political score
+    g = g.subgraph(table.index[table["political_score"].notna()]).copy()
 
     # Save the graph
-    nx.write_gexf(
+    save_graph(
         g,
         os.path.join(
             config["PATHS"]["INTERMEDIATE_FILES"],
@@ -84,7 +83,7 @@ if __name__ == "__main__":
         args = parse_cl_args()
         config = parse_config_file(args.config_file)
 
-        print("Build global .gexf graph with node attributes.")
+        print("Build global graph with node attributes.")
         build_global_graph_attributed(config)
         exit(0)
     except Exception as e:
@@ -6,8 +6,9 @@ Purpose:
 Input:
     - All inputs derived from the project config.ini file which is input with
         the '-c' flag.
-    - What is utilized in the script is a .gexf graph with node-level attributes
-        and some parameters for the algorithm.
+    - What is utilized in the script is a graph with node-level attributes
+        (pickled by 012_build_global_network_with_node_attributes.py) and some
+        parameters for the algorithm.
 
 Output:
     - LT_output.pkl
@@ -22,13 +23,12 @@ Authors:
 """
 import os
 
-import networkx as nx
 import numpy as np
 import pickle as pkl
 
 from copy import deepcopy
 from collections import defaultdict
-from utils import parse_cl_args, parse_config_file
+from utils import load_graph, parse_cl_args, parse_config_file
 
 
 class OpinionDynamicsGraph:
@@ -127,7 +127,7 @@ if __name__ == "__main__":
         output_file_name = config["FILES"]["LT_OUTPUT"]
 
         print("Loading global retweeting graph attributed.")
-        original_graph = nx.read_gexf(
+        original_graph = load_graph(
             os.path.join(
                 config["PATHS"]["INTERMEDIATE_FILES"],
                 config["FILES"]["GLOBAL_RETWEETING_GRAPH_ATTRIBUTED"],
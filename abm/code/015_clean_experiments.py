@@ -7,22 +7,32 @@ Inputs:
 
 Outputs:
     Daily and cumulative results, with all parameters.
+    The aggregated results of each simulation file are cached, so that only
+    new or changed files are cleaned when the script is run again.
 
 
 Author: Matthew DeVerna
 """
+import concurrent.futures
 import datetime
 import glob
+import json
 import os
 
 import pandas as pd
 import pickle as pkl
 import numpy as np
 
-from collections import Counter
-
+from simulation_results import BinCount, Unique, scan
 from utils import parse_cl_args, parse_config_file
 
+# Infections are counted at time steps 1, ..., MAX_TIME
+MAX_TIME = 100
+
+# Cache of the aggregated results of each simulation file, within SIMULATION_RESULTS_CLEAN
+MANIFEST_FILE = "clean_manifest.json"
+PARTIALS_DIR = "clean_partials"
+
 
 def extract_parameters(file):
     """
@@ -51,99 +61,212 @@ def extract_parameters(file):
     return parameters
 
 
-def get_infected_for_all_exp(df):
+def infection_counts_table(experiments, counts):
     """
-    Calculate the number of infected nodes at each time step for each experiment
+    Convert a (num. experiments, max_time) array of infection counts into a
+    | experiment | infection_time | num_infected | table with one row per
+    experiment and time step (1, ..., max_time).
     """
+    max_time = counts.shape[1]
+    num_infected = pd.DataFrame(
+        {
+            "experiment": np.repeat(np.asarray(experiments), max_time),
+            "infection_time": np.tile(np.arange(1, max_time + 1), len(experiments)),
+            "num_infected": counts.ravel(),
+        }
+    )
+    return num_infected
 
-    temp_results_list = []
 
-    for exp in df.exp.unique():
-        # Select an individual experiment's results
-        exp_mask = df.exp == exp
-        one_exp = df[exp_mask]
+def get_infected_for_all_exp(df, max_time=MAX_TIME):
+    """
+    Calculate the number of infected nodes at each time step for each experiment
 
-        # Create dictionary where key is infection time and value is num infected
-        infected_counts = Counter(one_exp.infection_time)
+    Parameters:
+    ----------
+    - df (pd.DataFrame) : simulation results with (at least) the `exp` and
+        `infection_time` columns
+    - max_time (int) : last time step counted. Time steps are 1, ..., max_time
+
+    Returns:
+    ----------
+    - num_infected (pd.DataFrame) : | experiment | infection_time | num_infected |
+        with one row per experiment and time step
+
+    Notes:
+    ----------
+    All counts come from a single np.bincount over (experiment, infection_time)
+    codes, see simulation_results.BinCount. Infection times outside 1, ..., max_time
+    (e.g., NaN for nodes that were never infected) are not counted.
+    """
+    infected = BinCount("infection_time", max_time, offset=1, by="exp")
+    infected.update(df)
+    return infection_counts_table(*infected.result())
 
-        # Add the experiment number, time, and number of infected to the list
-        for idx in range(1, 101):
-            temp_results_list.append((exp, idx, infected_counts[idx]))
 
-    num_infected = pd.DataFrame(
-        temp_results_list, columns=["experiment", "infection_time", "num_infected"]
+def aggregate_experiments(exp_infection_counts, total_nodes, parameters):
+    """
+    Aggregate (mean, std) the daily infection counts of all experiments of one
+    simulation file and add the parameters used to create the contact network.
+    """
+    agg_results = (
+        exp_infection_counts.groupby(["infection_time"])["num_infected"]
+        .mean()
+        .reset_index()
+    )
+    agg_results = agg_results.rename(columns={"num_infected": "mean_infected"})
+    agg_results["std"] = (
+        exp_infection_counts.groupby(["infection_time"])["num_infected"]
+        .std()
+        .reset_index()["num_infected"]
     )
-    return num_infected
 
+    agg_results["cum_infected"] = np.cumsum(agg_results["mean_infected"])
 
-if __name__ == "__main__":
-    args = parse_cl_args()
-    config = parse_config_file(args.config_file)
+    # Now we calculate these relative to the total number of nodes in the network
+    proportions = agg_results[["mean_infected", "std", "cum_infected"]] / total_nodes
+    proportions = proportions.rename(
+        columns={
+            "mean_infected": "prop_mean_infected",
+            "std": "prop_std",
+            "cum_infected": "prop_cum_infected",
+        }
+    )
 
-    # Used below
-    frames = []
-    total_nodes_map = dict()
+    # Combine raw counts with proportions
+    agg_results = pd.concat([agg_results, proportions], axis=1)
 
-    simulation_folder = config["PATHS"]["SIMULATION_RESULTS"]
-    for file in glob.glob(os.path.join(simulation_folder, "*.parquet")):
-        print(f"Cleaning {file}...")
+    # Add parameters
+    agg_results["pop_sampled"] = float(parameters["pop_sampled"])
+    agg_results["lt_threshold"] = int(parameters["lt_threshold"])
+    agg_results["num_edges"] = int(parameters["num_edges"])
+    return agg_results
 
-        parameters = extract_parameters(file)
-        full_path = os.path.join(simulation_folder, file)
 
-        df = pd.read_parquet(full_path)
+def clean_simulation_file(file, partial_path):
+    """
+    Clean a single simulation file and save its aggregated daily results.
 
-        # Get the total number of nodes for later
-        total_nodes = df.id.nunique()
-        total_nodes_map[float(parameters["pop_sampled"])] = total_nodes
+    Parameters:
+    ----------
+    - file (str) : path to the simulation results (.parquet)
+    - partial_path (str) : where the aggregated results are saved (.parquet)
 
-        # Count the number of nodes that got infected at each time step for each experiment
-        exp_infection_counts = get_infected_for_all_exp(df)
+    Returns:
+    ----------
+    - total_nodes (int) : number of nodes in the simulated network
+    """
+    print(f"Cleaning {file}...")
 
-        # Calculate aggregate results (mean, std)
-        agg_results = (
-            exp_infection_counts.groupby(["infection_time"])["num_infected"]
-            .mean()
-            .reset_index()
-        )
-        agg_results = agg_results.rename(columns={"num_infected": "mean_infected"})
-        agg_results["std"] = (
-            exp_infection_counts.groupby(["infection_time"])["num_infected"]
-            .std()
-            .reset_index()["num_infected"]
-        )
+    parameters = extract_parameters(file)
 
-        agg_results["cum_infected"] = np.cumsum(agg_results["mean_infected"])
+    # Stream the file (only the columns used below are loaded) and count:
+    #   - the number of nodes that got infected at each time step for each experiment
+    #   - the total number of nodes, for later
+    infected = BinCount("infection_time", MAX_TIME, offset=1, by="exp")
+    nodes = Unique("id")
+    scan(file, [infected, nodes])
 
-        # Now we calculate these relative to the total number of nodes in the network
-        proportions = (
-            agg_results[["mean_infected", "std", "cum_infected"]] / total_nodes
-        )
-        proportions = proportions.rename(
-            columns={
-                "mean_infected": "prop_mean_infected",
-                "std": "prop_std",
-                "cum_infected": "prop_cum_infected",
-            }
-        )
+    total_nodes = len(nodes.result())
+    exp_infection_counts = infection_counts_table(*infected.result())
+
+    agg_results = aggregate_experiments(exp_infection_counts, total_nodes, parameters)
+    agg_results.to_parquet(partial_path)
+    return total_nodes
 
-        # Combine raw counts with proportions
-        agg_results = pd.concat([agg_results, proportions], axis=1)
 
-        # Add parameters
-        agg_results["pop_sampled"] = float(parameters["pop_sampled"])
-        agg_results["lt_threshold"] = int(parameters["lt_threshold"])
-        agg_results["num_edges"] = int(parameters["num_edges"])
+def load_manifest(manifest_path):
+    """
+    Load the manifest of cleaned simulation files. Form:
+        --> {file path : {"size": bytes, "mtime": mtime, "total_nodes": int}}
+    """
+    if not os.path.exists(manifest_path):
+        return dict()
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
 
-        frames.append(agg_results)
+def save_manifest(manifest, manifest_path):
+    """Save the manifest of cleaned simulation files (atomically)."""
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(manifest_path + ".tmp", manifest_path)
 
-    # Combine them all into a single frame
+
+def clean_experiments(config):
+    """
+    Clean all simulation files and combine their aggregated daily results.
+
+    The aggregated results of each file are cached in PARTIALS_DIR and recorded in a
+    manifest with the size and modification time of the file. Only new or
+    changed files are cleaned, in parallel if more than one worker is set by
+    NUM_WORKERS in the [VARIABLES] section of the config file.
+    """
+    simulation_folder = config["PATHS"]["SIMULATION_RESULTS"]
+    out_dir = config["PATHS"]["SIMULATION_RESULTS_CLEAN"]
+    partials_dir = os.path.join(out_dir, PARTIALS_DIR)
+    os.makedirs(partials_dir, exist_ok=True)
+
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    manifest = load_manifest(manifest_path)
+
+    files = sorted(glob.glob(os.path.join(simulation_folder, "*.parquet")))
+
+    # Forget files that have been removed since the last run
+    manifest = {file: entry for file, entry in manifest.items() if file in files}
+
+    # Collect new or changed files
+    jobs = dict()
+    for file in files:
+        stat = os.stat(file)
+        entry = manifest.get(file)
+        partial_path = os.path.join(partials_dir, os.path.basename(file))
+        if (
+            entry is not None
+            and entry["size"] == stat.st_size
+            and entry["mtime"] == stat.st_mtime
+            and os.path.exists(partial_path)
+        ):
+            continue
+        manifest.pop(file, None)
+        jobs[file] = (partial_path, {"size": stat.st_size, "mtime": stat.st_mtime})
+    print(f"{len(files) - len(jobs)} files already cleaned, {len(jobs)} to clean.")
+
+    def record(file, total_nodes):
+        manifest[file] = {**jobs[file][1], "total_nodes": total_nodes}
+        save_manifest(manifest, manifest_path)
+
+    num_workers = config.getint("VARIABLES", "NUM_WORKERS", fallback=1)
+    if num_workers <= 1:
+        for file, (partial_path, _) in jobs.items():
+            record(file, clean_simulation_file(file, partial_path))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=num_workers
+        ) as executor:
+            futures = {
+                executor.submit(clean_simulation_file, file, partial_path): file
+                for file, (partial_path, _) in jobs.items()
+            }
+            for future in concurrent.futures.as_completed(futures):
+                # Raise errors from the workers
+                record(futures[future], future.result())
+    save_manifest(manifest, manifest_path)
+
+    # Combine the cached results into a single frame
+    frames = []
+    total_nodes_map = dict()
+    for file in files:
+        frames.append(
+            pd.read_parquet(os.path.join(partials_dir, os.path.basename(file)))
+        )
+        pop_sampled = float(extract_parameters(file)["pop_sampled"])
+        total_nodes_map[pop_sampled] = manifest[file]["total_nodes"]
     all_experiments = pd.concat(frames)
 
     # Save files
     today_dtobj = datetime.datetime.today()
     today_str = datetime.datetime.strftime(today_dtobj, "%Y-%m-%d")
-    out_dir = config["PATHS"]["SIMULATION_RESULTS_CLEAN"]
     outfname = os.path.join(out_dir, f"{today_str}__clean_daily_and_cum.parquet")
     all_experiments.to_parquet(outfname)
 
@@ -153,4 +276,11 @@ if __name__ == "__main__":
     with open(map_out_name, "wb") as f:
         pkl.dump(total_nodes_map, f, protocol=pkl.HIGHEST_PROTOCOL)
 
+
+if __name__ == "__main__":
+    args = parse_cl_args()
+    config = parse_config_file(args.config_file)
+
+    clean_experiments(config)
+
     print("\n----- Script complete -----")
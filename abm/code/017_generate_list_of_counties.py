@@ -15,7 +15,7 @@ Author: Matthew DeVerna
 """
 import os
 
-import pandas as pd
+from simulation_results import unique
 
 # Ensure the current working directory is where this script is saved
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
@@ -30,11 +30,10 @@ fpath = os.path.join(
     # Doesn't matter which one we use here as long as it is pop_sampled_0.1
     "2023-10-18_09-52__SIR_results__lt_threshold_4__pop_sampled_0.1__min_user_thresh_200__num_edges_20__.parquet",
 )
-print("Loading file, this may take a while and requires ~8GBs of RAM or more...")
-df = pd.read_parquet(fpath)
+print("Streaming file, this may take a while...")
 
-# Get list of unique FIPS
-fips_list = df["fip"].unique()
+# Get list of unique FIPS (only the "fip" column is read, one batch at a time)
+fips_list = unique(fpath, "fip")
 print("Total number of unique FIPS: ", len(fips_list))
 
 # Save to a file with one FIP per line
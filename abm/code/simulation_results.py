@@ -0,0 +1,227 @@
+"""
+Streaming access to (potentially huge) per-node simulation results.
+
+A results file is read one batch of rows at a time, loading only the columns that
+are needed. Simple equality filters, e.g. {"exp": 3} or {"fip": ["18105", "18097"]},
+are pushed down to the reader: row groups whose min/max statistics exclude all the
+requested values are skipped without being read, and the remaining rows are
+filtered batch by batch. Reducers (unique values, row counts, bincounts) are
+updated with each batch, so memory usage does not depend on the size of the file.
+
+E.g.:
+    >>> fips = Unique("fip")
+    >>> num_rows = Count()
+    >>> scan(path, [fips, num_rows], filters={"exp": 0})
+    >>> fips.result(), num_rows.result()
+
+Utilized by:
+    - 015_clean_experiments.py
+    - 017_generate_list_of_counties.py
+
+Author: Matthew DeVerna
+"""
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+BATCH_SIZE = 1_000_000
+
+
+class Unique:
+    """
+    Unique values of `column`, in order of first appearance.
+    """
+
+    def __init__(self, column):
+        self.columns = [column]
+        self.column = column
+        self._values = None
+
+    def update(self, df):
+        values = pd.Index(pd.unique(df[self.column]))
+        if self._values is None:
+            self._values = values
+        else:
+            self._values = self._values.append(values[~values.isin(self._values)])
+
+    def result(self):
+        if self._values is None:
+            return np.array([])
+        return self._values.to_numpy()
+
+
+class Count:
+    """
+    Number of rows.
+    """
+
+    def __init__(self):
+        self.columns = []
+        self._count = 0
+
+    def update(self, df):
+        self._count += len(df)
+
+    def result(self):
+        return self._count
+
+
+class BinCount:
+    """
+    Counts of the integer values offset, ..., offset + length - 1 of `column`,
+    optionally for each group of the `by` column. Other values (including NaN)
+    are not counted.
+    """
+
+    def __init__(self, column, length, offset=0, by=None):
+        """
+        Parameters
+        ----------
+        - column (str) : column with the values to count
+        - length (int) : number of bins
+        - offset (int) : value counted in the first bin
+        - by (str) : if not None, values are counted separately for each group
+        """
+        self.columns = [column] if by is None else [by, column]
+        self.column = column
+        self.length = length
+        self.offset = offset
+        self.by = by
+        self._groups = Unique(by) if by is not None else None
+        self._counts = np.zeros((0 if by is not None else 1, length), dtype=np.int64)
+
+    def update(self, df):
+        values = df[self.column].to_numpy(dtype=float, na_value=np.nan) - self.offset
+        valid = (values >= 0) & (values < self.length)
+        bins = values[valid].astype(np.int64)
+
+        if self.by is None:
+            self._counts[0] += np.bincount(bins, minlength=self.length)
+            return
+
+        # Code groups in order of first appearance and grow the counts as needed
+        self._groups.update(df)
+        groups = pd.Index(self._groups.result())
+        codes = groups.get_indexer(df[self.by])[valid]
+        if len(groups) > len(self._counts):
+            self._counts = np.vstack(
+                [
+                    self._counts,
+                    np.zeros(
+                        (len(groups) - len(self._counts), self.length), dtype=np.int64
+                    ),
+                ]
+            )
+        self._counts += np.bincount(
+            codes * self.length + bins, minlength=len(groups) * self.length
+        ).reshape(len(groups), self.length)
+
+    def result(self):
+        """
+        Returns
+        -------
+        - counts (np.ndarray) : counts[i] is the number of values equal to offset + i
+        or, if `by` is set:
+        - groups (np.ndarray) : the groups, in order of first appearance
+        - counts (np.ndarray) : counts[g, i] is the number of values equal to
+            offset + i in group groups[g]
+        """
+        if self.by is None:
+            return self._counts[0]
+        return self._groups.result(), self._counts
+
+
+def _keep_row_group(row_group, column_positions, filters):
+    """
+    Return False if the statistics of `row_group` show that no row can match
+    `filters`.
+    """
+    for column, values in filters.items():
+        statistics = row_group.column(column_positions[column]).statistics
+        if statistics is None or not statistics.has_min_max:
+            continue
+        try:
+            if not any(statistics.min <= value <= statistics.max for value in values):
+                return False
+        except TypeError:
+            # Values not comparable with the statistics, the rows are checked later
+            continue
+    return True
+
+
+def iter_batches(path, columns, filters=None, batch_size=BATCH_SIZE):
+    """
+    Stream a parquet file as pd.DataFrame batches.
+
+    Parameters
+    ----------
+    - path (str) : parquet file
+    - columns (list) : columns to load
+    - filters (dict) : {column : value or list of values}. Only rows matching
+        all filters are returned
+    - batch_size (int) : maximum number of rows per batch
+
+    Yields
+    -------
+    pd.DataFrame with `columns` (filter columns are dropped if not requested)
+    """
+    filters = {
+        column: values if isinstance(values, (list, tuple, set)) else [values]
+        for column, values in (filters or dict()).items()
+    }
+
+    parquet_file = pq.ParquetFile(path)
+    column_positions = {
+        parquet_file.schema_arrow.field(i).name: i
+        for i in range(len(parquet_file.schema_arrow))
+    }
+    row_groups = [
+        i
+        for i in range(parquet_file.num_row_groups)
+        if _keep_row_group(
+            parquet_file.metadata.row_group(i), column_positions, filters
+        )
+    ]
+    if not row_groups:
+        return
+
+    to_read = list(dict.fromkeys(list(columns) + list(filters)))
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, row_groups=row_groups, columns=to_read
+    ):
+        df = batch.to_pandas()
+        for column, values in filters.items():
+            df = df[df[column].isin(values)]
+        yield df[list(columns)]
+
+
+def scan(path, reducers, filters=None, batch_size=BATCH_SIZE):
+    """
+    Update all `reducers` with a single pass over a parquet file.
+
+    Parameters
+    ----------
+    - path (str) : parquet file
+    - reducers (list) : reducers (e.g., Unique, Count, BinCount)
+    - filters (dict) : {column : value or list of values}, see iter_batches
+    - batch_size (int) : maximum number of rows per batch
+
+    Returns
+    -------
+    The list of reducers (already updated)
+    """
+    columns = list(dict.fromkeys(c for reducer in reducers for c in reducer.columns))
+    for df in iter_batches(path, columns, filters=filters, batch_size=batch_size):
+        for reducer in reducers:
+            reducer.update(df)
+    return reducers
+
+
+def unique(path, column, filters=None):
+    """Unique values of `column`, in order of first appearance."""
+    return scan(path, [Unique(column)], filters=filters)[0].result()
+
+
+def count(path, filters=None):
+    """Number of rows (matching `filters`)."""
+    return scan(path, [Count()], filters=filters)[0].result()
@@ -0,0 +1,261 @@
+"""
+Compact, memory-mapped tweet id -> value maps and account -> tweet ids indexes.
+
+A map is saved as a directory of .npy files: one sorted int64 array of tweet ids and
+one parallel array for each value column. String columns are dictionary encoded
+(integer codes + the distinct strings stored as one byte buffer with offsets), so
+that every file can be memory-mapped. Lookups binary-search the tweet ids, which
+means a map can be probed in batches without loading it into memory.
+
+Account -> tweet ids indexes are saved in CSR form: sorted account ids, an offsets
+array and one tweet id array in which the tweets of each account are contiguous.
+
+Utilized by:
+    - 006_map_tweets_to_cred_score.py (to create the maps and the index)
+    - 007_build_global_rt_network.py, 008_get_political_score.py and
+        009_build_account_table.py (to probe them)
+
+Authors:
+    - Francesco Pierri
+    - Matthew DeVerna
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+META_FILE = "meta.json"
+KEYS_FILE = "tweet_id.npy"
+
+
+def save_tweet_map(path, tweet_ids, columns):
+    """
+    Save a tweet id -> values map to the directory `path`.
+
+    Parameters
+    ----------
+    - path (str) : output directory (created if it does not exist)
+    - tweet_ids (array-like) : tweet ids (int64)
+    - columns (dict) : {column name : array-like of values}, each aligned with
+        `tweet_ids`. Numeric arrays are saved as is. Strings (object arrays or
+        pd.Categorical) are dictionary encoded.
+
+    Notes
+    -------
+    If a tweet id appears more than once, its last value is kept.
+    """
+    tweet_ids = np.asarray(tweet_ids, dtype=np.int64)
+
+    # Stable sort so that, within duplicates, the last value stays last
+    order = np.argsort(tweet_ids, kind="stable")
+    sorted_ids = tweet_ids[order]
+    is_last = np.ones(len(sorted_ids), dtype=bool)
+    is_last[:-1] = sorted_ids[1:] != sorted_ids[:-1]
+    order = order[is_last]
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, KEYS_FILE), sorted_ids[is_last])
+
+    kinds = dict()
+    for name, values in columns.items():
+        if isinstance(values, pd.Series):
+            values = values.array
+        if isinstance(values, pd.Categorical) or np.asarray(values).dtype.kind in "OUS":
+            if isinstance(values, pd.Categorical):
+                codes, categories = values.codes, values.categories
+            else:
+                codes, categories = pd.factorize(np.asarray(values, dtype=object))
+            _save_strings(path, name, np.asarray(codes)[order], categories)
+            kinds[name] = "string"
+        else:
+            np.save(os.path.join(path, f"{name}.npy"), np.asarray(values)[order])
+            kinds[name] = "numeric"
+
+    with open(os.path.join(path, META_FILE), "w") as f:
+        json.dump({"columns": kinds}, f)
+
+
+def _save_strings(path, name, codes, categories):
+    """Save dictionary encoded strings as codes, offsets and a byte buffer."""
+    encoded = [str(category).encode("utf-8") for category in categories]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(category) for category in encoded])
+    code_dtype = np.int32 if len(encoded) < np.iinfo(np.int32).max else np.int64
+    np.save(os.path.join(path, f"{name}.codes.npy"), codes.astype(code_dtype))
+    np.save(os.path.join(path, f"{name}.offsets.npy"), offsets)
+    np.save(
+        os.path.join(path, f"{name}.data.npy"),
+        np.frombuffer(b"".join(encoded), dtype=np.uint8),
+    )
+
+
+class TweetMap:
+    """
+    A memory-mapped tweet id -> values map created by `save_tweet_map`.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        - path (str) : directory the map was saved to
+        """
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.kinds = json.load(f)["columns"]
+        self.tweet_ids = self._load(KEYS_FILE)
+
+    def __len__(self):
+        return len(self.tweet_ids)
+
+    def _load(self, file_name):
+        return np.load(os.path.join(self.path, file_name), mmap_mode="r")
+
+    def _decode(self, name, codes):
+        """Convert the codes of string column `name` to an object array."""
+        offsets = self._load(f"{name}.offsets.npy")
+        data = self._load(f"{name}.data.npy")
+        values = np.full(len(codes), None, dtype=object)
+        valid = codes >= 0
+        unique_codes, inverse = np.unique(codes[valid], return_inverse=True)
+        strings = np.array(
+            [
+                bytes(data[offsets[code] : offsets[code + 1]]).decode("utf-8")
+                for code in unique_codes
+            ],
+            dtype=object,
+        )
+        values[valid] = strings[inverse]
+        return values
+
+    def locate(self, tweet_ids):
+        """
+        Find the positions of `tweet_ids` in the map.
+
+        Parameters
+        ----------
+        - tweet_ids (array-like) : tweet ids (int64)
+
+        Returns
+        -------
+        - positions (np.ndarray) : position of each tweet id in the map
+            (only meaningful where `found` is True)
+        - found (np.ndarray) : boolean mask of the tweet ids present in the map
+        """
+        tweet_ids = np.asarray(tweet_ids, dtype=np.int64)
+        if len(self.tweet_ids) == 0:
+            return np.zeros(len(tweet_ids), dtype=np.int64), np.zeros(
+                len(tweet_ids), dtype=bool
+            )
+        positions = np.searchsorted(self.tweet_ids, tweet_ids)
+        positions = np.minimum(positions, len(self.tweet_ids) - 1)
+        found = np.asarray(self.tweet_ids[positions]) == tweet_ids
+        return positions, found
+
+    def lookup(self, tweet_ids, columns=None):
+        """
+        Look up the values of a batch of tweet ids.
+
+        Parameters
+        ----------
+        - tweet_ids (array-like) : tweet ids (int64)
+        - columns (list) : value columns to return. Default: all of them
+
+        Returns
+        -------
+        pd.DataFrame aligned with `tweet_ids`, with the requested columns and a
+        boolean "found" column. Values of tweet ids that are not in the map are
+        NaN (numeric columns) or None (string columns).
+        """
+        positions, found = self.locate(tweet_ids)
+        positions = positions[found]
+        result = pd.DataFrame({"found": found})
+        for name in columns or list(self.kinds):
+            if self.kinds[name] == "string":
+                codes = np.full(len(found), -1, dtype=np.int64)
+                codes[found] = self._load(f"{name}.codes.npy")[positions]
+                result[name] = self._decode(name, codes)
+            else:
+                values = np.full(len(found), np.nan)
+                values[found] = self._load(f"{name}.npy")[positions]
+                result[name] = values
+        return result
+
+
+def save_account_tweets(path, account_ids, tweet_ids):
+    """
+    Save an account -> tweet ids index to the directory `path`.
+
+    Parameters
+    ----------
+    - path (str) : output directory (created if it does not exist)
+    - account_ids (array-like) : account id (int64) of each tweet
+    - tweet_ids (array-like) : tweet ids (int64), aligned with `account_ids`
+
+    Notes
+    -------
+    The tweets of each account keep the order in which they were provided.
+    """
+    account_ids = np.asarray(account_ids, dtype=np.int64)
+    tweet_ids = np.asarray(tweet_ids, dtype=np.int64)
+
+    order = np.argsort(account_ids, kind="stable")
+    accounts, counts = np.unique(account_ids[order], return_counts=True)
+    offsets = np.zeros(len(accounts) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(counts)
+
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "account_id.npy"), accounts)
+    np.save(os.path.join(path, "offsets.npy"), offsets)
+    np.save(os.path.join(path, KEYS_FILE), tweet_ids[order])
+
+
+class AccountTweets:
+    """
+    A memory-mapped account -> tweet ids index created by `save_account_tweets`.
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        - path (str) : directory the index was saved to
+        """
+        self.path = path
+        self.account_ids = np.load(os.path.join(path, "account_id.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        self.tweet_ids = np.load(os.path.join(path, KEYS_FILE), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.account_ids)
+
+    def _position(self, account_id):
+        """Return the position of `account_id`, or None if it is not indexed."""
+        position = np.searchsorted(self.account_ids, account_id)
+        if (
+            position < len(self.account_ids)
+            and self.account_ids[position] == account_id
+        ):
+            return position
+        return None
+
+    def __contains__(self, account_id):
+        return self._position(int(account_id)) is not None
+
+    def __getitem__(self, account_id):
+        position = self._position(int(account_id))
+        if position is None:
+            raise KeyError(account_id)
+        start, end = self.offsets[position], self.offsets[position + 1]
+        return np.asarray(self.tweet_ids[start:end])
+
+    def num_tweets(self):
+        """Return the number of tweets of each account, aligned with `account_ids`."""
+        return np.diff(self.offsets)
+
+    def items(self):
+        """Iterate over (account_id, tweet ids array) pairs, sorted by account id."""
+        for position, account_id in enumerate(self.account_ids):
+            start, end = self.offsets[position], self.offsets[position + 1]
+            yield int(account_id), np.asarray(self.tweet_ids[start:end])
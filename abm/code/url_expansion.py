@@ -0,0 +1,408 @@
+"""
+Asynchronous expansion of shortened URLs, utilized by 004_expand_urls.py.
+
+All requests share a single connection pool. The number of requests in flight is
+capped globally and for each shortener host, and redirect chains are cut after a
+fixed number of hops.
+
+Expansions are also stored in a persistent cache (`ExpansionCache`) shared by all
+days so that each short URL only goes to the network once, and streamed to a daily
+append-only log (`ExpansionLog`) so that interrupted days can be resumed.
+
+Running this module directly benchmarks the expander against a local stand-in for
+slow and redirecting URL shorteners (no internet connection needed). E.g.:
+    python url_expansion.py --num-urls 5000 --delay 0.2 --hops 3
+
+Authors:
+    - Kaicheng Yang
+    - Francesco Pierri
+    - Matthew DeVerna
+"""
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import time
+
+import aiohttp
+
+from aiohttp import web
+from urllib.parse import urlparse
+
+HEADERS = {
+    "user-agent": "Mozilla/5.0 (compatible; HoaxyBot/1.0 +http://cnets.indiana.edu; truthy@indiana.edu)"
+}
+HTTP_TIMEOUT = 20
+MAX_CONCURRENCY = 100
+MAX_PER_HOST = 10
+MAX_REDIRECTS = 10
+FAILED_TTL_DAYS = 7
+CHECKPOINT_EVERY = 1000
+
+
+class AsyncURLExpander:
+    """
+    A class to expand shortened URLs concurrently with asyncio.
+    """
+
+    def __init__(
+        self,
+        max_concurrency=MAX_CONCURRENCY,
+        max_per_host=MAX_PER_HOST,
+        host_limits=None,
+        max_redirects=MAX_REDIRECTS,
+        timeout=HTTP_TIMEOUT,
+        fallback=None,
+    ):
+        """
+        Parameters
+        ----------
+        - max_concurrency (int) : maximum number of URLs being expanded at once
+        - max_per_host (int) : maximum number of URLs being expanded at once for
+            each shortener host (e.g., "bit.ly")
+        - host_limits (dict) : per-host overrides of `max_per_host`,
+            e.g., {"t.co": 50}
+        - max_redirects (int) : maximum number of redirects followed for one URL
+        - timeout (int) : total number of seconds allowed for one request
+        - fallback (callable) : optional blocking function (e.g., urlexpander.expand)
+            that is tried, in a worker thread, on URLs the HEAD request did not
+            expand. It should take a URL and return its expanded form.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_per_host = max_per_host
+        self.host_limits = host_limits or dict()
+        self.max_redirects = max_redirects
+        self.timeout = timeout
+        self.fallback = fallback
+
+    async def _fetch_full_url(self, session, short_url):
+        """
+        Fetch the full URL of `short_url` by sending an HTTP HEAD request. Returns
+        None if the request fails.
+        """
+        try:
+            async with session.head(
+                short_url, allow_redirects=True, max_redirects=self.max_redirects
+            ) as r:
+                base_url = str(r.url)
+            if not base_url.endswith("/"):
+                base_url = base_url + "/"
+        except Exception as e:
+            print(f"{short_url}: {e!r}")
+            return None
+        return base_url
+
+    async def _expand_one(
+        self, session, global_limit, host_limit, short_url, on_result=None
+    ):
+        """
+        Expand a single URL while holding both the host and the global semaphore.
+        Returns None if the URL could not be expanded.
+        """
+        # Wait for the host first, so that URLs queued behind a busy host do not
+        # hold global slots that URLs of other hosts could use
+        async with host_limit:
+            async with global_limit:
+                expanded_url = await self._fetch_full_url(session, short_url)
+
+                # Use the fallback if the URL wasn't expanded
+                if expanded_url in (None, short_url) and self.fallback is not None:
+                    try:
+                        expanded_url = await asyncio.to_thread(self.fallback, short_url)
+                    except Exception:
+                        expanded_url = None
+
+        # A URL that expands to itself was not expanded
+        if expanded_url == short_url:
+            expanded_url = None
+
+        if on_result is not None:
+            on_result(short_url, expanded_url)
+        return expanded_url
+
+    async def expand_all(self, urls, on_result=None):
+        """
+        Expand all `urls` concurrently.
+
+        Parameters
+        ----------
+        - urls (iterable) : the shortened URLs to expand
+        - on_result (callable) : optional function called as
+            `on_result(short_url, expanded_url)` as soon as each URL is done.
+            `expanded_url` is None if the URL could not be expanded.
+
+        Returns
+        -------
+        - list of (short_url, expanded_url) tuples, in the same order as `urls`.
+            URLs that could not be expanded are excluded.
+        """
+        urls = list(urls)
+        global_limit = asyncio.Semaphore(self.max_concurrency)
+        host_limits = dict()
+        for url in urls:
+            host = urlparse(url).netloc
+            if host not in host_limits:
+                limit = self.host_limits.get(host, self.max_per_host)
+                host_limits[host] = asyncio.Semaphore(limit)
+
+        connector = aiohttp.TCPConnector(limit=self.max_concurrency)
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        async with aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers=HEADERS
+        ) as session:
+            expanded = await asyncio.gather(
+                *(
+                    self._expand_one(
+                        session,
+                        global_limit,
+                        host_limits[urlparse(url).netloc],
+                        url,
+                        on_result,
+                    )
+                    for url in urls
+                )
+            )
+
+        return [(url, new) for url, new in zip(urls, expanded) if new is not None]
+
+    def expand(self, urls, on_result=None):
+        """
+        Blocking wrapper around `expand_all` that also prints the expansion rate.
+        """
+        start = time.perf_counter()
+        results = asyncio.run(self.expand_all(urls, on_result))
+        elapsed = time.perf_counter() - start
+        rate = len(results) / elapsed if elapsed else 0.0
+        print(f"Expanded {len(results):,} URLs in {elapsed:.1f}s ({rate:,.1f} URLs/s)")
+        return results
+
+
+class ExpansionCache:
+    """
+    A persistent sqlite cache of URL expansions shared by all days.
+
+    Successful expansions are kept forever. Failed lookups are also recorded so that
+    they are not retried every day, but they expire after `failed_ttl_days` so that
+    temporarily unreachable shorteners are eventually tried again.
+    """
+
+    def __init__(self, cache_path, failed_ttl_days=FAILED_TTL_DAYS):
+        """
+        Parameters
+        ----------
+        - cache_path (str) : path to the sqlite file backing the cache
+        - failed_ttl_days (float) : number of days before a failed lookup is retried
+        """
+        self.failed_ttl = failed_ttl_days * 24 * 60 * 60
+        self._conn = sqlite3.connect(cache_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS url_expansions "
+            "(short_url TEXT PRIMARY KEY, expanded_url TEXT, fetched_at REAL NOT NULL)"
+        )
+
+    def lookup(self, urls):
+        """
+        Split `urls` into those with a usable cache entry and those that must be
+        fetched.
+
+        Parameters
+        ----------
+        - urls (iterable) : short URLs
+
+        Returns
+        -------
+        - expanded (dict) : {short_url : expanded_url} for cached expansions
+        - num_failed (int) : number of URLs skipped due to a recent failed lookup
+        - to_fetch (list) : URLs not in the cache, or whose failure has expired
+        """
+        expanded = dict()
+        num_failed = 0
+        to_fetch = []
+        expiry = time.time() - self.failed_ttl
+        for url in urls:
+            row = self._conn.execute(
+                "SELECT expanded_url, fetched_at FROM url_expansions "
+                "WHERE short_url = ?",
+                (url,),
+            ).fetchone()
+            if row is None:
+                to_fetch.append(url)
+            elif row[0] is not None and row[0] != url:
+                expanded[url] = row[0]
+            elif row[1] > expiry:
+                num_failed += 1
+            else:
+                to_fetch.append(url)
+        return expanded, num_failed, to_fetch
+
+    def store(self, fetched_urls, results):
+        """
+        Save the outcome of fetching `fetched_urls`.
+
+        Parameters
+        ----------
+        - fetched_urls (list) : all URLs that were sent to the network
+        - results (list) : (short_url, expanded_url) tuples of the successful
+            expansions. URLs missing from `results`, or expanded to themselves,
+            are recorded as failures.
+        """
+        now = time.time()
+        expanded = {old: new for old, new in results if new != old}
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO url_expansions VALUES (?, ?, ?)",
+            ((url, expanded.get(url), now) for url in fetched_urls),
+        )
+        self._conn.commit()
+
+    def close(self):
+        """Close the underlying database."""
+        self._conn.close()
+
+
+class ExpansionLog:
+    """
+    An append-only log of the URLs expanded on one day.
+
+    Each outcome is written as one JSON line as soon as it is available and the
+    file is flushed to disk every `checkpoint_every` lines. If a run is
+    interrupted, the URLs already in the log are read back and skipped on the
+    next run.
+    """
+
+    def __init__(self, log_path, checkpoint_every=CHECKPOINT_EVERY):
+        """
+        Parameters
+        ----------
+        - log_path (str) : path to the log file (created if it does not exist)
+        - checkpoint_every (int) : number of lines written between checkpoints
+        """
+        self.log_path = log_path
+        self.checkpoint_every = checkpoint_every
+        self.done, num_bytes = self._read()
+        self._file = open(log_path, "a")
+        # Drop an incomplete last line left behind by a killed run
+        self._file.truncate(num_bytes)
+        self._pending = 0
+
+    def _read(self):
+        """
+        Read all complete lines in the log.
+
+        Returns
+        -------
+        - done (dict) : {short_url : expanded_url or None}
+        - num_bytes (int) : size of the complete lines, in bytes
+        """
+        done = dict()
+        num_bytes = 0
+        if not os.path.exists(self.log_path):
+            return done, num_bytes
+        with open(self.log_path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                short_url, expanded_url = json.loads(line)
+                done[short_url] = expanded_url
+                num_bytes += len(line)
+        return done, num_bytes
+
+    def append(self, short_url, expanded_url):
+        """Record the outcome of a single URL."""
+        self._file.write(json.dumps([short_url, expanded_url]) + "\n")
+        self.done[short_url] = expanded_url
+        self._pending += 1
+        if self._pending >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Make sure everything written so far is on disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def close(self):
+        """Checkpoint and close the log file."""
+        self.checkpoint()
+        self._file.close()
+
+    def remove(self):
+        """Delete the log once the day's final output has been saved."""
+        os.remove(self.log_path)
+
+
+def make_stand_in_shortener(delay, hops):
+    """
+    Create a local web app that mimics a slow URL shortener.
+
+    "/s/{id}" redirects `hops` times before landing on "/final/{id}". Every
+    response is delayed by `delay` seconds.
+    """
+
+    async def shortened(request):
+        await asyncio.sleep(delay)
+        url_id = request.match_info["url_id"]
+        hop = int(request.query.get("hop", 0))
+        if hop < hops:
+            location = f"/s/{url_id}?hop={hop + 1}"
+        else:
+            location = f"/final/{url_id}"
+        raise web.HTTPFound(location)
+
+    async def final(request):
+        await asyncio.sleep(delay)
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_route("*", "/s/{url_id}", shortened)
+    app.router.add_route("*", "/final/{url_id}", final)
+    return app
+
+
+async def benchmark(num_urls, delay, hops, max_concurrency, max_per_host):
+    """
+    Expand `num_urls` URLs served by the stand-in shortener on localhost and print
+    the number of expansions per second.
+    """
+    runner = web.AppRunner(make_stand_in_shortener(delay, hops))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+
+    expander = AsyncURLExpander(
+        max_concurrency=max_concurrency, max_per_host=max_per_host
+    )
+    urls = [f"http://127.0.0.1:{port}/s/{ix}" for ix in range(num_urls)]
+    try:
+        start = time.perf_counter()
+        results = await expander.expand_all(urls)
+        elapsed = time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    num_final = sum("/final/" in new for _, new in results)
+    print(f"Expanded {num_final:,}/{num_urls:,} URLs in {elapsed:.2f}s")
+    print(f"{num_final / elapsed:,.1f} expansions per second")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the URL expander against a local stand-in shortener."
+    )
+    parser.add_argument("--num-urls", type=int, default=1000)
+    parser.add_argument("--delay", type=float, default=0.1, help="Seconds/response.")
+    parser.add_argument("--hops", type=int, default=2, help="Redirects per URL.")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY)
+    parser.add_argument("--max-per-host", type=int, default=MAX_PER_HOST)
+    args = parser.parse_args()
+
+    asyncio.run(
+        benchmark(
+            args.num_urls,
+            args.delay,
+            args.hops,
+            args.max_concurrency,
+            args.max_per_host,
+        )
+    )
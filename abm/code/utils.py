@@ -3,6 +3,31 @@ Convenience functions used in scripts throughout the project.
 """
 import argparse
 import configparser
+import glob
+import os
+
+import pandas as pd
+import pickle as pkl
+
+# Columns of the account location tables created by 003_account_tid_location_match.py
+LOCATION_COLUMNS = [
+    "account_id",
+    "location",
+    "country",
+    "state",
+    "county",
+    "city",
+    "carmen_id",
+]
+LOCATION_DTYPES = {
+    "account_id": "int64",
+    "location": "string",
+    "country": "string",
+    "state": "string",
+    "county": "string",
+    "city": "string",
+    "carmen_id": "Int64",
+}
 
 
 def parse_cl_args():
@@ -44,3 +69,105 @@ def parse_config_file(config_file_path):
     except Exception as e:
         print("Problem parsing config file.")
         print(e)
+
+
+def build_location_table(records):
+    """
+    Create a typed account location table.
+
+    Parameters
+    ----------
+    - records (iterable) : tuples ordered like `LOCATION_COLUMNS`. Accounts that
+        carmen could not match have None for all carmen fields.
+
+    Returns
+    -------
+    pd.DataFrame with `LOCATION_COLUMNS` as columns
+    """
+    table = pd.DataFrame.from_records(list(records), columns=LOCATION_COLUMNS)
+    return table.astype(LOCATION_DTYPES)
+
+
+def load_us_county_accounts(config):
+    """
+    Load the accounts that carmen geolocated to a county within the United States.
+
+    Parameters
+    ----------
+    - config : contents of the project configuration file
+
+    Returns
+    -------
+    pd.DataFrame indexed by account id (str, to ensure consistency with nodes and
+    account ids elsewhere) with "county" and "state" columns
+    """
+    table = pd.read_parquet(
+        os.path.join(
+            config["PATHS"]["INTERMEDIATE_FILES"],
+            config["FILES"]["ACCOUNT_LOCATION_TABLE"],
+        ),
+        columns=["account_id", "location", "country", "state", "county"],
+    )
+
+    # Accounts without a location string, or without a state and county, are skipped
+    non_empty = (table[["location", "state", "county"]].fillna("") != "").all(axis=1)
+    in_us = (table["country"] == "United States").fillna(False)
+    table = table.loc[non_empty & in_us, ["account_id", "county", "state"]]
+    table["account_id"] = table["account_id"].astype(str)
+    return table.set_index("account_id")
+
+
+def list_url_fact_days(config):
+    """
+    Return the sorted list of days (YYYY-mm-dd) in the tweet -> URL -> domain
+    fact table created by 004_expand_urls.py.
+    """
+    partitions = glob.glob(os.path.join(config["PATHS"]["URL_FACTS_FOLDER"], "day=*"))
+    return sorted(os.path.basename(path).replace("day=", "") for path in partitions)
+
+
+def read_url_facts(config, columns, day=None, last_day=None):
+    """
+    Read the tweet -> URL -> domain fact table created by 004_expand_urls.py.
+
+    Parameters
+    ----------
+    - config : contents of the project configuration file
+    - columns (list) : columns to read. Any of "day", "tweet_id", "account_id",
+        "url", "expanded_url" and "domain"
+    - day (str) : if provided, only read this day (YYYY-mm-dd)
+    - last_day (str) : if provided, only read days up to and including this one
+
+    Returns
+    -------
+    pd.DataFrame with the requested columns
+    """
+    filters = []
+    if day is not None:
+        filters.append(("day", "==", day))
+    if last_day is not None:
+        filters.append(("day", "<=", last_day))
+
+    facts = pd.read_parquet(
+        config["PATHS"]["URL_FACTS_FOLDER"],
+        columns=columns,
+        filters=filters or None,
+    )
+    if "day" in facts.columns:
+        facts["day"] = facts["day"].astype(str)
+    return facts
+
+
+def save_graph(graph, path):
+    """
+    Save a networkx graph as a pickle. Much faster to write and read back than
+    .gexf and node/edge attributes keep their Python types.
+    """
+    with open(path, "wb") as f:
+        pkl.dump(graph, f, protocol=pkl.HIGHEST_PROTOCOL)
+
+
+def load_graph(path):
+    """Load a networkx graph saved with `save_graph`."""
+    with open(path, "rb") as f:
+        return pkl.load(f)
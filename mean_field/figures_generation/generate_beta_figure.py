@@ -13,6 +13,7 @@ Author:
     Matthew R. DeVerna
 """
 import os
+import sys
 
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
@@ -27,9 +28,14 @@ RESULTS_DIR = "../sim_results/effects_of_beta"
 if os.path.basename(os.getcwd()) != CURR_DIR:
     raise Exception(f"Must run this script from the `{CURR_DIR}` directory!")
 
+# Load simulation source code
+source_dir = "../src"
+sys.path.insert(0, source_dir)
+from sweeps import load_daily, long_format, select
+
 ### Load simulation results ###
 tot_df = pd.read_csv(os.path.join(RESULTS_DIR, "cum_infections.csv"))
-daily_infection_df = pd.read_csv(os.path.join(RESULTS_DIR, "daily_infections.csv"))
+daily_infections = load_daily(os.path.join(RESULTS_DIR, "daily_infections.npz"))
 r0_df = pd.read_csv(os.path.join(RESULTS_DIR, "r0s.csv"))
 
 ### Set up some stuff for the figure ###
@@ -61,6 +67,7 @@ ax3 = plt.subplot(grid[1, 1])
 
 # Less beta values highlighted for one of the plots
 less_betas = [0.2, 0.4, 0.6, 0.8, 1.0]
+daily_infection_df = long_format(select(daily_infections, {"beta": less_betas}))
 for beta in less_betas:
     selected_df = daily_infection_df[daily_infection_df["beta"] == beta]
 
@@ -31,14 +31,15 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 source_dir = "../src"
 sys.path.insert(0, source_dir)
 from simulations import get_peak_day
+from sweeps import load_daily, long_format
 
 ### Load simulation results ###
 mixed_str = "_mixed" if MIXED else ""
 total_infected_df = pd.read_csv(
     os.path.join(RESULTS_DIR, f"total_infected{mixed_str}.csv")
 )
-daily_infected_df = pd.read_csv(
-    os.path.join(RESULTS_DIR, f"daily_infected{mixed_str}.csv")
+daily_infected_df = long_format(
+    load_daily(os.path.join(RESULTS_DIR, f"daily_infected{mixed_str}.npz"))
 )
 
 # Set the font size for all text
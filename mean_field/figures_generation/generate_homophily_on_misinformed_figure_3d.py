@@ -31,10 +31,8 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 MIXED = True
 mixed_str = "_mixed" if MIXED else ""
 
-daily_fname = os.path.join(RESULTS_DIR, f"daily_infected{mixed_str}.csv")
 total_fname = os.path.join(RESULTS_DIR, f"total_infected{mixed_str}.csv")
 
-daily_frame = pd.read_csv(daily_fname)
 total_frame = pd.read_csv(total_fname)
 
 column_name_map = {
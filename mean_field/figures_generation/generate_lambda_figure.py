@@ -31,17 +31,24 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 source_dir = "../src"
 sys.path.insert(0, source_dir)
 from simulations import get_peak_day
+from sweeps import load_daily, long_format, select
 
 ### Load simulation results ###
 totals_df = pd.read_csv(os.path.join(RESULTS_DIR, "total_infected_all_settings.csv"))
-by_day_df = pd.read_csv(os.path.join(RESULTS_DIR, "daily_infected_all_settings.csv"))
+by_day = load_daily(os.path.join(RESULTS_DIR, "daily_infected_all_settings.npz"))
 
 # Select specific lambda values and parameter settings
-temp_df = by_day_df[
-    (by_day_df["lambda"].isin([1, 2, 3]))  # , 3.3, 4]))
-    & (by_day_df["beta"] == 0.3)
-    & (by_day_df["frac_ord"] == 0.5)
-]
+temp_df = long_format(
+    select(
+        by_day,
+        {
+            "lambda": [1, 2, 3],  # , 3.3, 4],
+            "beta": 0.3,
+            "frac_ord": 0.5,
+        },
+    )
+)
+temp_df["infections_total"] = temp_df["infections_mis"] + temp_df["infections_ord"]
 
 # Create the figure and grid layout
 fig = plt.figure(figsize=(10, 6))
@@ -21,15 +21,6 @@ import matplotlib.pyplot as plt
 import pandas as pd
 
 
-### Load simulation results ###
-totals_df = pd.read_csv(
-    os.path.join("../sim_results/effects_of_lambda", "total_infected_all_settings.csv")
-)
-by_day_df = pd.read_csv(
-    os.path.join("../sim_results/effects_of_lambda", "daily_infected_all_settings.csv")
-)
-
-
 OUT_DIR = "../figures"
 CURR_DIR = "figures_generation"
 RESULTS_DIR = "../sim_results/effects_of_lambda"
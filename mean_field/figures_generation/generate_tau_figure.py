@@ -13,6 +13,7 @@ Author:
     Matthew R. DeVerna
 """
 import os
+import sys
 
 import matplotlib.pyplot as plt
 import matplotlib.gridspec as gridspec
@@ -27,9 +28,14 @@ RESULTS_DIR = "../sim_results/effects_of_tau"
 if os.path.basename(os.getcwd()) != CURR_DIR:
     raise Exception(f"Must run this script from the `{CURR_DIR}` directory!")
 
+# Load simulation source code
+source_dir = "../src"
+sys.path.insert(0, source_dir)
+from sweeps import load_daily, long_format, select
+
 ### Load simulation results ###
 peak_day_df = pd.read_csv(os.path.join(RESULTS_DIR, "peak_days.csv"))
-daily_infection_df = pd.read_csv(os.path.join(RESULTS_DIR, "daily_infections.csv"))
+daily_infections = load_daily(os.path.join(RESULTS_DIR, "daily_infections.npz"))
 r0_df = pd.read_csv(os.path.join(RESULTS_DIR, "r0s.csv"))
 
 
@@ -53,6 +59,9 @@ ax1 = plt.subplot(grid[:, 0])
 ax2 = plt.subplot(grid[0, 1])
 ax3 = plt.subplot(grid[1, 1])
 
+daily_infection_df = long_format(
+    select(daily_infections, {"recovery": list(color_map.keys())})
+)
 for rec_day in color_map.keys():
     selected_df = daily_infection_df[daily_infection_df["recovery"] == rec_day]
 
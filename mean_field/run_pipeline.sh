@@ -35,6 +35,7 @@ echo "##########################################"
 echo ""
 echo ""
 
+echo "Running validate_solvers.py ..."; python3 validate_solvers.py || exit 1
 echo "Running simulate_effects_of_beta.py ..."; python3 simulate_effects_of_beta.py
 echo "Running simulate_effects_of_rec_period.py ..."; python3 simulate_effects_of_rec_period.py
 echo "Running simulate_effects_of_lambda_all_settings.py ..."; python3 simulate_effects_of_lambda_all_settings.py
@@ -8,7 +8,8 @@ Inputs:
 Outputs:
     Output Directory: sim_results/effects_of_beta
     - r0s.csv : the R_0 value given a particular beta
-    - daily_infections.csv : proportion of the network infected by day
+    - daily_infections.npz : proportion of the network infected by day, one row
+        per beta (see `sweeps.save_daily`)
     - cum_infections.csv : the cumulative proportion of the population infected
         at the end of the simulation
 
@@ -23,6 +24,7 @@ import numpy as np
 import pandas as pd
 
 OUT_DIR = "../sim_results"
+CACHE_DIR = "../sim_results/cache"  # Results shared by all sweeps
 SUB_DIR = "effects_of_beta"
 CURR_DIR = "sim_scripts"
 # Ensure we are in the data_analysis directory for paths to work
@@ -32,56 +34,39 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 # Load simulation source code
 source_dir = "../src"
 sys.path.insert(0, source_dir)
-from simulations import run_simulation
+from sweeps import run_sweep, save_daily
 
 
 ### SET SIMULATION PARAMETERS ###
-frac_ord = 1  # No misinformed for initial simulations
-prop_infected = 0.001
-num_days = 100
-recovery_days = 5
-beta_mult = 1  # This doesn't really matter here
-homophily = False  # Not tested here
-alpha = 0.5  # Full mixing (homophily tested later)
-
-# Storage
-r0_records = []
-tot_prop_infected_records = []
-daily_infection_records = []
+fixed = {
+    "frac_ord": 1,  # No misinformed for initial simulations
+    "prop_infec": 0.001,
+    "num_days": 100,
+    "recovery_days": 5,
+    "beta_mult": 1,  # This doesn't really matter here
+    "w_homophily": False,  # Not tested here
+    "alpha": 0.5,  # Full mixing (homophily tested later)
+    "mixed": True,
+}
+grid = {"beta_ord": np.arange(0.02, 1.02, 0.02)}
 
 # Simulations
-beta_values = np.arange(0.02, 1.02, 0.02)
-for beta in beta_values:
-    S_o, S_m, I_o, I_m, R_o, R_m, r0s = run_simulation(
-        frac_ord=frac_ord,
-        prop_infec=prop_infected,
-        num_days=num_days,
-        beta_ord=beta,
-        recovery_days=recovery_days,
-        beta_mult=beta_mult,
-        w_homophily=homophily,
-        alpha=alpha,
-        mixed=True,
-    )
-
-    # Below r0s = (r0_ord, r0_mis, r0_weighted)
-    # All are identical in this simulation
-    r0_records.append({"beta": beta, "r0": r0s[0]})
-    tot_prop_infected_records.append({"beta": beta, "total_infected": max(R_o)})
-
-    for day, prop in enumerate(I_o):
-        daily_infection_records.append(
-            {"beta": beta, "day": day, "prop_infected": prop}
-        )
+out_dir = os.path.join(OUT_DIR, SUB_DIR)
+results = run_sweep(grid, fixed, out_dir, outputs=["I_o", "R_o"], cache_dir=CACHE_DIR)
+betas = results["beta_ord"]
 
-# Convert to dfs
-r0_df = pd.DataFrame.from_records(r0_records)
-daily_infection_df = pd.DataFrame.from_records(daily_infection_records)
-tot_df = pd.DataFrame.from_records(tot_prop_infected_records)
+# Below r0s = (r0_ord, r0_mis, r0_weighted)
+# All are identical in this simulation
+r0_df = pd.DataFrame({"beta": betas, "r0": results["ord_r0"]})
+tot_df = pd.DataFrame({"beta": betas, "total_infected": results["R_o"].max(axis=1)})
 
 ### Save results ###
-out_dir = os.path.join(OUT_DIR, SUB_DIR)
 os.makedirs(out_dir, exist_ok=True)
 r0_df.to_csv(os.path.join(out_dir, "r0s.csv"), index=False)
-daily_infection_df.to_csv(os.path.join(out_dir, "daily_infections.csv"), index=False)
+save_daily(
+    os.path.join(out_dir, "daily_infections.npz"),
+    columns={"beta": betas},
+    values={"prop_infected": results["I_o"]},
+    days=np.arange(fixed["num_days"]),
+)
 tot_df.to_csv(os.path.join(out_dir, "cum_infections.csv"), index=False)
@@ -11,7 +11,8 @@ Inputs:
 Outputs:
     Output Directory: sim_results/effects_of_homophily
     - total_infected.csv : the total proportion of the network that gets infected
-    - daily_infected.csv : proportion of the network infected by day
+    - daily_infected.npz : proportion of the network infected by day, one row
+        per alpha (see `sweeps.save_daily`)
 
 Author:
     Matthew R. DeVerna
@@ -24,6 +25,7 @@ import pandas as pd
 
 MIXED = True
 OUT_DIR = "../sim_results"
+CACHE_DIR = "../sim_results/cache"  # Results shared by all sweeps
 SUB_DIR = "effects_of_homophily"
 CURR_DIR = "sim_scripts"
 # Ensure we are in the data_analysis directory for paths to work
@@ -33,71 +35,54 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 # Load simulation source code
 source_dir = "../src"
 sys.path.insert(0, source_dir)
-from simulations import run_simulation
+from sweeps import run_sweep, save_daily
 
 ### SET SIMULATION PARAMETERS ###
-num_days = 100
-x = 0.5  # Initial proportion of ordinary people
-prop_infected = 0.001  # Initial proportion of infected
-rec_days = 5
-
-# Fixed based on results from previous analyses
-beta = 0.3
-lambduh = 3  # beta_misinformed = lambda * beta_ord
+fixed = {
+    "num_days": 100,
+    "frac_ord": 0.5,  # Initial proportion of ordinary people
+    "prop_infec": 0.001,  # Initial proportion of infected
+    "recovery_days": 5,
+    # Fixed based on results from previous analyses
+    "beta_ord": 0.3,
+    "beta_mult": 3,  # beta_misinformed = lambda * beta_ord
+    "w_homophily": True,
+    "mixed": MIXED,
+}
 
 # Homophily
-alphas = np.arange(0.5, 1.02, 0.02)
-
-# Result storage
-totals = []  # Total infections
-infection_flows = dict()  # Daily infections
+grid = {"alpha": np.arange(0.5, 1.02, 0.02)}
 
 # Run simulations
-for alpha in alphas:
-    # Run the simulation based on the input
-    S_o, S_m, I_o, I_m, R_o, R_m, r0s = run_simulation(
-        frac_ord=x,
-        prop_infec=prop_infected,
-        num_days=num_days,
-        beta_ord=beta,
-        recovery_days=rec_days,
-        beta_mult=lambduh,
-        w_homophily=True,
-        alpha=alpha,
-        mixed=MIXED,
-    )
-    total_ord_inf = max(R_o)
-    total_mis_inf = max(R_m)
-
-    infection_flows[alpha] = I_o + I_m
-
-    totals.append(
-        {
-            "alpha": alpha,
-            "total_ord_inf": total_ord_inf,
-            "total_mis_inf": total_mis_inf,
-            "total": total_ord_inf + total_mis_inf,
-        }
-    )
+out_dir = os.path.join(OUT_DIR, SUB_DIR)
+results = run_sweep(
+    grid, fixed, out_dir, outputs=["I_o", "I_m", "R_o", "R_m"], cache_dir=CACHE_DIR
+)
+alphas = results["alpha"]
 
 ### Total proportion of the network that gets infected ###
-total_infected_df = pd.DataFrame(totals)
-
-### Daily proportion of the network that gets infected ###
-daily_infected_df = pd.DataFrame(infection_flows).reset_index()
-daily_infected_df = daily_infected_df.rename(columns={"index": "day"})
-daily_infected_df.day = daily_infected_df.day + 1
-daily_infected_df = daily_infected_df.melt(id_vars="day")
-daily_infected_df.rename(columns={"variable": "alpha"}, inplace=True)
-daily_infected_df.rename(columns={"value": "prop_infected"}, inplace=True)
+total_ord_inf = results["R_o"].max(axis=1)
+total_mis_inf = results["R_m"].max(axis=1)
+total_infected_df = pd.DataFrame(
+    {
+        "alpha": alphas,
+        "total_ord_inf": total_ord_inf,
+        "total_mis_inf": total_mis_inf,
+        "total": total_ord_inf + total_mis_inf,
+    }
+)
 
 ### Save results ###
-out_dir = os.path.join(OUT_DIR, SUB_DIR)
 os.makedirs(out_dir, exist_ok=True)
 mixed_str = "_mixed" if MIXED else ""
 total_infected_df.to_csv(
     os.path.join(out_dir, f"total_infected{mixed_str}.csv"), index=False
 )
-daily_infected_df.to_csv(
-    os.path.join(out_dir, f"daily_infected{mixed_str}.csv"), index=False
+
+### Daily proportion of the network that gets infected ###
+save_daily(
+    os.path.join(out_dir, f"daily_infected{mixed_str}.npz"),
+    columns={"alpha": alphas},
+    values={"prop_infected": results["I_o"] + results["I_m"]},
+    days=np.arange(1, fixed["num_days"] + 1),
 )
@@ -9,7 +9,8 @@ Inputs:
 Outputs:
     Output Directory: sim_results/effects_of_lambda
     - total_infected_all_settings.csv : the total proportion of the network that gets infected
-    - daily_infected_all_settings.csv : proportion of the network infected by day
+    - daily_infected_all_settings.npz : proportion of each group infected by day,
+        one row per (lambda, beta, frac_ord) setting (see `sweeps.save_daily`)
 
 Author:
     Matthew R. DeVerna
@@ -22,6 +23,7 @@ import numpy as np
 import pandas as pd
 
 OUT_DIR = "../sim_results"
+CACHE_DIR = "../sim_results/cache"  # Results shared by all sweeps
 SUB_DIR = "effects_of_lambda"
 CURR_DIR = "sim_scripts"
 # Ensure we are in the data_analysis directory for paths to work
@@ -31,15 +33,21 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 # Load simulation source code
 source_dir = "../src"
 sys.path.insert(0, source_dir)
-from simulations import run_simulation
+from sweeps import run_sweep, save_daily
 
 ### SET SIMULATION PARAMETERS ###
-num_days = 100
+fixed = {
+    "num_days": 100,
+    "prop_infec": 0.001,  # Initial proportion of infected
+    "recovery_days": 5,
+    "w_homophily": False,
+    "alpha": None,
+    "mixed": True,
+}
 
 # Initial proportion of ordinary people
 x = 1 - np.array([0.001, 0.01, 0.1, 0.2, 0.3, 0.4, 0.5])
 x = x[::-1]
-prop_infected = 0.001  # Initial proportion of infected
 
 # beta_misinformed = lambda * beta_ord
 lambdas_low = np.arange(1, 10.2, 0.2)
@@ -50,52 +58,32 @@ lambdas = sorted([round(val, 2) for val in lambdas])
 
 # Fixed based on results from previous analyses
 betas = [0.001, 0.01, 0.1, 0.2, 0.3]
-rec_days = 5
-
-# Result storage
-totals = []  # Total infections
-# Will store the progression of infections over time, indexed by parameter settings
-infection_flows_ord = dict()
-infection_flows_mis = dict()
-
-for beta in betas:
-    for lambduh in lambdas:
-        for frac_ord in x:
-            # Run the simulation based on the input
-            S_o, S_m, I_o, I_m, R_o, R_m, r0s = run_simulation(
-                frac_ord=frac_ord,
-                prop_infec=prop_infected,
-                num_days=num_days,
-                beta_ord=beta,
-                recovery_days=rec_days,
-                beta_mult=lambduh,
-                w_homophily=False,
-                alpha=None,
-                mixed=True,
-            )
-
-            # Daily incidence
-            infection_flows_ord[(np.round(lambduh, 1), beta, frac_ord)] = I_o
-            infection_flows_mis[(np.round(lambduh, 1), beta, frac_ord)] = I_m
-
-            # Total infected
-            total_ord_inf = max(R_o)
-            total_mis_inf = max(R_m)
-            totals.append(
-                {
-                    "total_ord_inf": total_ord_inf,
-                    "total_mis_inf": total_mis_inf,
-                    "lambda": lambduh,
-                    "beta": beta,
-                    "frac_ord": frac_ord,
-                    "diff": total_mis_inf - total_ord_inf,
-                    "total_inf": total_ord_inf + total_mis_inf,
-                    "r0": r0s[-1],
-                }
-            )
-
-# Convert total infections to a DataFrame
-totals_df = pd.DataFrame.from_records(totals)
+
+# Settings are expanded like the nested loops
+# `for beta in betas: for lambduh in lambdas: for frac_ord in x:`
+grid = {"beta_ord": betas, "beta_mult": lambdas, "frac_ord": x}
+
+# Run all simulations
+out_dir = os.path.join(OUT_DIR, SUB_DIR)
+results = run_sweep(
+    grid, fixed, out_dir, outputs=["I_o", "I_m", "R_o", "R_m"], cache_dir=CACHE_DIR
+)
+
+### Total proportion of the network that gets infected ###
+total_ord_inf = results["R_o"].max(axis=1)
+total_mis_inf = results["R_m"].max(axis=1)
+totals_df = pd.DataFrame(
+    {
+        "total_ord_inf": total_ord_inf,
+        "total_mis_inf": total_mis_inf,
+        "lambda": results["beta_mult"],
+        "beta": results["beta_ord"],
+        "frac_ord": results["frac_ord"],
+        "diff": total_mis_inf - total_ord_inf,
+        "total_inf": total_ord_inf + total_mis_inf,
+        "r0": results["weighted_avg_r0"],
+    }
+)
 
 # Calculate total "extra" infections compared to lambda = 1
 all_frames = []
@@ -109,37 +97,18 @@ totals_df = pd.concat(all_frames)
 # Include the fraction of misinformed
 totals_df["frac_mis"] = round(1 - totals_df["frac_ord"], 3)
 
-# Convert daily infection results into a dataframe
-mis_data = [
-    (day, lambda_, beta, frac_ord, infection)
-    for (lambda_, beta, frac_ord), infections in infection_flows_mis.items()
-    for day, infection in enumerate(infections, start=1)
-]
-ord_data = [
-    (day, lambda_, beta, frac_ord, infection)
-    for (lambda_, beta, frac_ord), infections in infection_flows_ord.items()
-    for day, infection in enumerate(infections, start=1)
-]
-
-mis_df = pd.DataFrame(
-    mis_data, columns=["day", "lambda", "beta", "frac_ord", "infections"]
-)
-ord_df = pd.DataFrame(
-    ord_data, columns=["day", "lambda", "beta", "frac_ord", "infections"]
-)
-
-by_day_results = mis_df.merge(
-    ord_df, on=["day", "lambda", "beta", "frac_ord"], suffixes=("_mis", "_ord")
-)
-
-by_day_results["infections_total"] = (
-    by_day_results["infections_mis"] + by_day_results["infections_ord"]
-)
-
 ### Save results ###
-out_dir = os.path.join(OUT_DIR, SUB_DIR)
 os.makedirs(out_dir, exist_ok=True)
 totals_df.to_csv(os.path.join(out_dir, "total_infected_all_settings.csv"), index=False)
-by_day_results.to_csv(
-    os.path.join(out_dir, "daily_infected_all_settings.csv"), index=False
+
+# Daily infections of each group
+save_daily(
+    os.path.join(out_dir, "daily_infected_all_settings.npz"),
+    columns={
+        "lambda": results["beta_mult"],
+        "beta": results["beta_ord"],
+        "frac_ord": results["frac_ord"],
+    },
+    values={"infections_mis": results["I_m"], "infections_ord": results["I_o"]},
+    days=np.arange(1, fixed["num_days"] + 1),
 )
@@ -9,7 +9,8 @@ Inputs:
 Outputs:
     Output Directory: sim_results/effects_of_tau
     - r0s.csv : the R_0 value given a particular beta
-    - daily_infections.csv : proportion of the network infected by day
+    - daily_infections.npz : proportion of the network infected by day, one row
+        per recovery period (see `sweeps.save_daily`)
     - peak_days.csv : the peak day of infection for each recovery period
 
 Author:
@@ -23,6 +24,7 @@ import numpy as np
 import pandas as pd
 
 OUT_DIR = "../sim_results"
+CACHE_DIR = "../sim_results/cache"  # Results shared by all sweeps
 SUB_DIR = "effects_of_tau"
 CURR_DIR = "sim_scripts"
 # Ensure we are in the data_analysis directory for paths to work
@@ -32,61 +34,48 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 # Load simulation source code
 source_dir = "../src"
 sys.path.insert(0, source_dir)
-from simulations import run_simulation, get_peak_day
+from simulations import get_peak_day
+from sweeps import run_sweep, save_daily
 
 
 ### SET SIMULATION PARAMETERS ###
-frac_ord = 1  # No misinformed for initial simulations
-prop_infected = 0.001
-num_days = 100
-recovery_days = 5  # recovery rate gamma = .2 where recovery days = 1/.2 = 5
-beta_mult = 1  # this doesn't really matter here
-homophily = False  # not tested here
-alpha = None  # full mixing (homophily tested later)
-
-# Will store the progression of infections over time, indexed by beta values
-# Storage
-r0_records = []
-peak_records = []
-daily_infection_records = []
-
-# We fix beta at .3 based on the above
-beta = 0.3
+fixed = {
+    "frac_ord": 1,  # No misinformed for initial simulations
+    "prop_infec": 0.001,
+    "num_days": 100,
+    "beta_mult": 1,  # this doesn't really matter here
+    "w_homophily": False,  # not tested here
+    "alpha": None,  # full mixing (homophily tested later)
+    "mixed": True,
+    # We fix beta at .3 based on the above
+    "beta_ord": 0.3,
+}
 
 # Simulate across various recovery periods
-recovery_days = np.arange(1, 21, 1)
-for rec_days in recovery_days:
-    # Run the simulation based on the input
-    S_o, S_m, I_o, I_m, R_o, R_m, r0s = run_simulation(
-        frac_ord=frac_ord,
-        prop_infec=prop_infected,
-        num_days=num_days,
-        beta_ord=beta,
-        recovery_days=rec_days,
-        beta_mult=beta_mult,
-        w_homophily=homophily,
-        alpha=None,
-        mixed=True,
-    )
-
-    # Below r0s = (r0_ord, r0_mis, r0_weighted)
-    # All are identical in this simulation
-    r0_records.append({"recovery": rec_days, "r0": r0s[0]})
-    peak_records.append({"recovery": rec_days, "peak_day": get_peak_day(I_o)})
+# (recovery rate gamma = .2 where recovery days = 1/.2 = 5)
+grid = {"recovery_days": np.arange(1, 21, 1)}
 
-    for day, prop in enumerate(I_o):
-        daily_infection_records.append(
-            {"recovery": rec_days, "day": day, "prop_infected": prop}
-        )
-
-# Convert to dfs
-r0_df = pd.DataFrame.from_records(r0_records)
-daily_infection_df = pd.DataFrame.from_records(daily_infection_records)
-peak_day_df = pd.DataFrame.from_records(peak_records)
+out_dir = os.path.join(OUT_DIR, SUB_DIR)
+results = run_sweep(grid, fixed, out_dir, outputs=["I_o"], cache_dir=CACHE_DIR)
+recovery_days = results["recovery_days"]
+
+# Below r0s = (r0_ord, r0_mis, r0_weighted)
+# All are identical in this simulation
+r0_df = pd.DataFrame({"recovery": recovery_days, "r0": results["ord_r0"]})
+peak_day_df = pd.DataFrame(
+    {
+        "recovery": recovery_days,
+        "peak_day": [get_peak_day(I_o) for I_o in results["I_o"]],
+    }
+)
 
 ### Save results ###
-out_dir = os.path.join(OUT_DIR, SUB_DIR)
 os.makedirs(out_dir, exist_ok=True)
 r0_df.to_csv(os.path.join(out_dir, "r0s.csv"), index=False)
-daily_infection_df.to_csv(os.path.join(out_dir, "daily_infections.csv"), index=False)
+save_daily(
+    os.path.join(out_dir, "daily_infections.npz"),
+    columns={"recovery": recovery_days},
+    values={"prop_infected": results["I_o"]},
+    days=np.arange(fixed["num_days"]),
+)
 peak_day_df.to_csv(os.path.join(out_dir, "peak_days.csv"), index=False)
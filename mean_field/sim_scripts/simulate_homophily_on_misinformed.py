@@ -11,7 +11,8 @@ Inputs:
 Outputs:
     Output Directory: sim_results/effects_of_homophily_on_misinformed
     - total_infected.csv : the total proportion of the network that gets infected
-    - daily_infected.csv : proportion of the network infected by day
+    - daily_infected.npz : proportion of the network infected by day, one row
+        per (alpha, beta) setting (see `sweeps.save_daily`)
 
 Author:
     Matthew R. DeVerna
@@ -25,6 +26,7 @@ import pandas as pd
 
 MIXED = True
 OUT_DIR = "../sim_results"
+CACHE_DIR = "../sim_results/cache"  # Results shared by all sweeps
 SUB_DIR = "effects_of_homophily_on_misinformed"
 CURR_DIR = "sim_scripts"
 # Ensure we are in the data_analysis directory for paths to work
@@ -35,75 +37,57 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 # Load simulation source code
 source_dir = "../src"
 sys.path.insert(0, source_dir)
-from simulations import run_simulation
+from sweeps import run_sweep, save_daily
 
 ### SET SIMULATION PARAMETERS ###
-num_days = 100
-x = 0.5  # Initial proportion of ordinary people
-prop_infected = 0.001  # Initial proportion of infected
-rec_days = 5
-
-# Fixed based on results from previous analyses
-beta = 0.15
-lambduh = 3  # beta_misinformed = lambda * beta_ord
-
-# Homophily
-alphas = np.arange(0.5, 1.01, 0.05)
-
-# Result storage
-totals = []  # Total infections
-infection_flows = []  # Daily infections
-
-betas = np.arange(0.1, 0.41, 0.01)
+fixed = {
+    "num_days": 100,
+    "frac_ord": 0.5,  # Initial proportion of ordinary people
+    "prop_infec": 0.001,  # Initial proportion of infected
+    "recovery_days": 5,
+    # Fixed based on results from previous analyses
+    "beta_mult": 3,  # beta_misinformed = lambda * beta_ord
+    "w_homophily": True,
+    "mixed": MIXED,
+}
+
+# Settings are expanded like the nested loops
+# `for beta in betas: for alpha in alphas:`
+grid = {
+    "beta_ord": np.arange(0.1, 0.41, 0.01),
+    "alpha": np.arange(0.5, 1.01, 0.05),  # Homophily
+}
 
 # Run simulations
-for beta in betas:
-    for alpha in alphas:
-        # Run the simulation based on the input
-        S_o, S_m, I_o, I_m, R_o, R_m, r0s = run_simulation(
-            frac_ord=x,
-            prop_infec=prop_infected,
-            num_days=num_days,
-            beta_ord=beta,
-            recovery_days=rec_days,
-            beta_mult=lambduh,
-            w_homophily=True,
-            alpha=alpha,
-            mixed=MIXED,
-        )
-
-        total_ord_inf = max(R_o)
-        total_mis_inf = max(R_m)
-
-        I = I_o + I_m
-        infection_flows.append(
-            {"alpha": alpha, "beta": beta, "day": day, "prop_infected": i}
-            for day, i in enumerate(I, start=1)
-        )
-
-        totals.append(
-            {
-                "alpha": alpha,
-                "beta": beta,
-                "total_ord_inf": total_ord_inf,
-                "total_mis_inf": total_mis_inf,
-                "total": total_ord_inf + total_mis_inf,
-            }
-        )
+out_dir = os.path.join(OUT_DIR, SUB_DIR)
+results = run_sweep(
+    grid, fixed, out_dir, outputs=["I_o", "I_m", "R_o", "R_m"], cache_dir=CACHE_DIR
+)
 
 ### Total proportion of the network that gets infected ###
-total_infected_df = pd.DataFrame(totals)
-
-### Daily proportion of the network that gets infected ###
-daily_infected_df = pd.DataFrame(infection_flows)
+total_ord_inf = results["R_o"].max(axis=1)
+total_mis_inf = results["R_m"].max(axis=1)
+total_infected_df = pd.DataFrame(
+    {
+        "alpha": results["alpha"],
+        "beta": results["beta_ord"],
+        "total_ord_inf": total_ord_inf,
+        "total_mis_inf": total_mis_inf,
+        "total": total_ord_inf + total_mis_inf,
+    }
+)
 
 ### Save results ###
-out_dir = os.path.join(OUT_DIR, SUB_DIR)
 os.makedirs(out_dir, exist_ok=True)
 mixed_str = "_mixed" if MIXED else ""
 total_infected_df.to_csv(
     os.path.join(out_dir, f"total_infected{mixed_str}.csv"), index=False
 )
-daily_infected_df.to_csv(
-    os.path.join(out_dir, f"daily_infected{mixed_str}.csv"), index=False
+
+### Daily proportion of the network that gets infected ###
+save_daily(
+    os.path.join(out_dir, f"daily_infected{mixed_str}.npz"),
+    columns={"alpha": results["alpha"], "beta": results["beta_ord"]},
+    values={"prop_infected": results["I_o"] + results["I_m"]},
+    days=np.arange(1, fixed["num_days"] + 1),
 )
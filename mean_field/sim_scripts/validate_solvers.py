@@ -0,0 +1,193 @@
+"""
+Purpose:
+    Sanity checks of the mean-field solvers, run before the simulations. Raises an
+    error if any check fails.
+
+    - Final sizes (`final_size`) are cross-checked against long RK45 runs,
+        including settings in which a group is never reached by the infection
+        (no initial infected in it and no contact with infected groups), and
+        on grids of more than one dimension.
+    - Population conservation (`validate`, `check_every`) holds for
+        `run_simulation` and `run_simulation_batch`, with Euler and RK45, and
+        `check_conservation` rejects a trajectory that loses people.
+
+Inputs:
+    None
+
+Outputs:
+    None. Results of the checks are printed.
+
+Author:
+    Matthew R. DeVerna
+"""
+
+import os
+import sys
+
+import numpy as np
+
+CURR_DIR = "sim_scripts"
+# Ensure we are in the data_analysis directory for paths to work
+if os.path.basename(os.getcwd()) != CURR_DIR:
+    raise Exception(f"Must run this script from the `{CURR_DIR}` directory!")
+
+# Load simulation source code
+source_dir = "../src"
+sys.path.insert(0, source_dir)
+from simulations import (
+    check_conservation,
+    final_size,
+    run_simulation,
+    run_simulation_batch,
+)
+
+CHECK_DAYS = 3000  # Long enough for all epidemics below to be over
+
+
+### Final sizes ###
+print("Checking final sizes against RK45 runs ...")
+
+# Full homophily without mixing: only the misinformed group is infected and the
+# ordinary group never is
+R_o, R_m = final_size(
+    frac_ord=0.5,
+    prop_infec=0.001,
+    beta_ord=0.3,
+    recovery_days=5,
+    beta_mult=3,
+    w_homophily=True,
+    alpha=1.0,
+    mixed=False,
+    check=True,
+    check_days=CHECK_DAYS,
+)
+if R_o[0] != 0:
+    raise AssertionError(f"Unreached ordinary group got infected: R_o = {R_o[0]}")
+
+# Nobody infected: no epidemic at all
+R_o, R_m = final_size(
+    frac_ord=0.5,
+    prop_infec=0,
+    beta_ord=0.3,
+    recovery_days=5,
+    beta_mult=3,
+    w_homophily=True,
+    alpha=0.7,
+    mixed=True,
+    check=True,
+    check_days=CHECK_DAYS,
+)
+if R_o[0] + R_m[0] != 0:
+    raise AssertionError(f"Epidemic without infected: R = {R_o[0] + R_m[0]}")
+
+# Grid of settings, with and without homophily and mixing
+frac_ord, beta_ord, beta_mult, alpha = (
+    grid.ravel()
+    for grid in np.meshgrid(
+        [0.5, 0.9, 1],
+        [0.05, 0.2, 0.3],
+        [1, 3],
+        [0.5, 0.8, 1.0],
+        indexing="ij",
+    )
+)
+for w_homophily in [False, True]:
+    for mixed in [False, True]:
+        final_size(
+            frac_ord=frac_ord,
+            prop_infec=0.001,
+            beta_ord=beta_ord,
+            recovery_days=5,
+            beta_mult=beta_mult,
+            w_homophily=w_homophily,
+            alpha=alpha,
+            mixed=mixed,
+            check=True,
+            check_days=CHECK_DAYS,
+        )
+
+# Grids of more than one dimension are broadcast against each other
+for w_homophily in [False, True]:
+    R_o, R_m = final_size(
+        frac_ord=np.linspace(0, 1, 11)[:, None],
+        prop_infec=0.01,
+        beta_ord=0.3,
+        recovery_days=4,
+        beta_mult=np.array([1, 2, 3, 10, 1000])[None, :],
+        w_homophily=w_homophily,
+        alpha=0.8,
+        check=True,
+        check_days=CHECK_DAYS,
+    )
+    if R_o.shape != (55,):
+        raise AssertionError(f"Final sizes of an 11 x 5 grid have shape {R_o.shape}")
+
+
+### Population conservation ###
+print("Checking population conservation ...")
+
+# `check_every` only applies to Euler, RK45 is checked at the end of the run
+params = dict(
+    prop_infec=0.001,
+    num_days=300,
+    beta_ord=0.3,
+    recovery_days=5,
+    beta_mult=3,
+    w_homophily=True,
+    alpha=0.7,
+)
+for method in ["euler", "rk45"]:
+    for mixed in [False, True]:
+        for counts in [False, True]:
+            run_simulation(
+                frac_ord=0.5,
+                **params,
+                mixed=mixed,
+                counts=counts,
+                N=10_000,
+                method=method,
+                validate=True,
+                check_every=10,
+            )
+            run_simulation_batch(
+                frac_ord=[0.5, 0.9, 1],
+                **params,
+                mixed=mixed,
+                counts=counts,
+                N=10_000,
+                method=method,
+                validate=True,
+                check_every=10,
+            )
+
+# The check must fail on trajectories that lose people, in a single simulation...
+S_o, S_m, I_o, I_m, R_o, R_m, r0s = run_simulation(
+    frac_ord=0.5, **params, validate=True, check_every=10
+)
+R_o = R_o.copy()
+R_o[-1] -= 0.01
+try:
+    check_conservation(
+        S_o + S_m + I_o + I_m + R_o + R_m, S_o[0] + S_m[0] + I_o[0] + I_m[0]
+    )
+except AssertionError:
+    pass
+else:
+    raise AssertionError("Conservation check passed on a trajectory losing people")
+
+# ... and in a single row of a batch
+S_o, S_m, I_o, I_m, R_o, R_m, r0s = run_simulation_batch(
+    frac_ord=[0.5, 0.9, 1], **params, validate=True, check_every=10
+)
+R_m = R_m.copy()
+R_m[1, 100:] -= 0.01
+try:
+    check_conservation(
+        S_o + S_m + I_o + I_m + R_o + R_m, (S_o + S_m + I_o + I_m)[:, :1]
+    )
+except AssertionError:
+    pass
+else:
+    raise AssertionError("Conservation check passed on a batch losing people")
+
+print("All checks passed.")
@@ -0,0 +1,249 @@
+"""
+On-disk, content-addressed cache of mean-field simulation results.
+
+Each simulated parameter setting is stored in its own .npy file, named by the hash
+of its normalised parameters and of the version of the simulation code. Parameters
+are normalised so that equivalent calls share an entry: numbers are compared as
+floats (5, 5.0 and np.int64(5) are the same), and parameters that do not affect the
+result are dropped (e.g., `alpha` without homophily, `N` without counts, the
+tolerances with method = "euler", `validate`). Values are not rounded, so a
+cached result is always the exact result of the requested parameters.
+
+The code version is the hash of `simulations.py`, so editing the model
+invalidates all previous entries. Old entries are simply never read again; delete
+the cache directory to reclaim the space.
+
+E.g.:
+    >>> S_o, S_m, I_o, I_m, R_o, R_m, r0s = cached_run_simulation(
+    ...     cache_dir="../sim_results/cache", frac_ord=0.5, prop_infec=0.001,
+    ...     num_days=100, beta_ord=0.3, recovery_days=5, beta_mult=3,
+    ...     w_homophily=False, alpha=None)
+
+Author: Matthew DeVerna
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import simulations
+from simulations import run_simulation_batch
+
+COMPARTMENTS = ["S_o", "S_m", "I_o", "I_m", "R_o", "R_m"]
+BATCH_PARAMS = [
+    "frac_ord",
+    "prop_infec",
+    "beta_ord",
+    "recovery_days",
+    "beta_mult",
+    "alpha",
+]
+
+
+def code_version():
+    """Return the hash of the simulation source code."""
+    with open(simulations.__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+CODE_VERSION = code_version()
+
+
+def normalize_params(
+    frac_ord,
+    prop_infec,
+    num_days,
+    beta_ord,
+    recovery_days,
+    beta_mult,
+    w_homophily,
+    alpha,
+    mixed=False,
+    counts=False,
+    N=None,
+    method="euler",
+    rtol=1e-6,
+    atol=1e-9,
+):
+    """
+    Return the parameters of a single simulation as a dict in which equivalent
+    parameter settings are identical. Parameters are those of `run_simulation`.
+    """
+    params = {
+        "frac_ord": float(frac_ord),
+        "prop_infec": float(prop_infec),
+        "num_days": int(num_days),
+        "beta_ord": float(beta_ord),
+        "recovery_days": float(recovery_days),
+        "beta_mult": float(beta_mult),
+        "w_homophily": bool(w_homophily),
+        "mixed": bool(mixed),
+        "counts": bool(counts),
+        "method": str(method),
+    }
+    if params["w_homophily"]:
+        params["alpha"] = float(alpha)
+    if params["counts"]:
+        params["N"] = float(N)
+    if params["method"] != "euler":
+        params["rtol"] = float(rtol)
+        params["atol"] = float(atol)
+    return params
+
+
+def cache_key(params):
+    """
+    Return the key (a hex digest) of the normalised `params` (see
+    `normalize_params`) under the current code version.
+    """
+    # repr() of a float round-trips exactly, so no two settings share a key
+    content = json.dumps(
+        {
+            "code": CODE_VERSION,
+            "params": {name: repr(value) for name, value in sorted(params.items())},
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def cache_path(cache_dir, key):
+    """Return the file of `key`, in a subdirectory named by its first characters."""
+    return os.path.join(cache_dir, key[:2], f"{key}.npy")
+
+
+def load_result(cache_dir, key):
+    """
+    Return the cached (S_o, S_m, I_o, I_m, R_o, R_m, r0s) of `key`, or None if
+    it is not in the cache.
+    """
+    try:
+        result = np.load(cache_path(cache_dir, key))
+    except FileNotFoundError:
+        return None
+    # See `save_result` for the layout
+    return (*result[3:].reshape(6, -1), tuple(result[:3].tolist()))
+
+
+def save_result(cache_dir, key, compartments, r0s):
+    """
+    Save the (num_days,) arrays `compartments` (see COMPARTMENTS) and the three
+    `r0s` of one simulation under `key`, as a single flat array: the r0s followed
+    by each compartment.
+    """
+    path = cache_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Write to a temporary file first, so that only complete entries exist
+    # (the pid avoids clashes between processes saving the same entry)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.concatenate([np.asarray(r0s, dtype=float), *compartments]))
+    os.replace(tmp_path, path)
+
+
+def cached_run_simulation(cache_dir, **params):
+    """
+    Same as `run_simulation` (the parameters must be passed by name), but results
+    are read from / written to the cache in `cache_dir`.
+    """
+    *compartments, r0s = cached_run_simulation_batch(cache_dir, **params)
+    return (
+        *(values[0] for values in compartments),
+        tuple(float(r0[0]) for r0 in r0s),
+    )
+
+
+def cached_run_simulation_batch(
+    cache_dir,
+    frac_ord,
+    prop_infec,
+    num_days,
+    beta_ord,
+    recovery_days,
+    beta_mult,
+    w_homophily,
+    alpha,
+    mixed=False,
+    counts=False,
+    N=None,
+    method="euler",
+    rtol=1e-6,
+    atol=1e-9,
+    validate=False,
+    check_every=None,
+):
+    """
+    Same as `run_simulation_batch`, but only the parameter settings that are not
+    in the cache in `cache_dir` are simulated (with a single batched call). Their
+    results are then added to the cache.
+
+    Parameters:
+    -----------
+    - cache_dir (str) : directory of the cache (created if it does not exist)
+    - All other parameters : see `run_simulation_batch`
+
+    Returns
+    -----------
+    Same as `run_simulation_batch`
+    """
+    # Broadcast the parameters against each other and flatten them, like
+    # `setup_batch`
+    values = np.broadcast_arrays(
+        *(
+            np.asarray(value, dtype=float)
+            for value in [
+                frac_ord,
+                prop_infec,
+                beta_ord,
+                recovery_days,
+                beta_mult,
+                alpha if w_homophily else np.nan,
+            ]
+        )
+    )
+    batch = {name: value.ravel() for name, value in zip(BATCH_PARAMS, values)}
+    num_params = len(batch["frac_ord"])
+    options = {
+        "w_homophily": w_homophily,
+        "mixed": mixed,
+        "counts": counts,
+        "N": N,
+        "method": method,
+        "rtol": rtol,
+        "atol": atol,
+    }
+    keys = [
+        cache_key(
+            normalize_params(
+                num_days=num_days,
+                **{name: values[idx] for name, values in batch.items()},
+                **options,
+            )
+        )
+        for idx in range(num_params)
+    ]
+
+    results = [load_result(cache_dir, key) for key in keys]
+    missing = [idx for idx, result in enumerate(results) if result is None]
+    if missing:
+        *compartments, r0s = run_simulation_batch(
+            num_days=num_days,
+            **{name: values[missing] for name, values in batch.items()},
+            **options,
+            validate=validate,
+            check_every=check_every,
+        )
+        for row, idx in enumerate(missing):
+            result_compartments = [values[row] for values in compartments]
+            result_r0s = tuple(float(r0[row]) for r0 in r0s)
+            save_result(cache_dir, keys[idx], result_compartments, result_r0s)
+            results[idx] = (*result_compartments, result_r0s)
+
+    S_o, S_m, I_o, I_m, R_o, R_m = (
+        np.stack([result[pos] for result in results]) for pos in range(6)
+    )
+    r0s = tuple(np.array([result[6][pos] for result in results]) for pos in range(3))
+    return S_o, S_m, I_o, I_m, R_o, R_m, r0s
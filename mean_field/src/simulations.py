@@ -15,6 +15,20 @@ def get_peak_day(infected_array):
     return np.where(np.array(infected_array) == max(infected_array))[0][0] + 1
 
 
+def check_conservation(totals, expected):
+    """
+    Ensure that the total population is conserved, because individuals should
+    simply be shifting between compartments. Raises an AssertionError otherwise.
+
+    Parameters:
+    -----------
+    - totals (float/np.ndarray) : total population (summed over compartments)
+    - expected (float/np.ndarray) : total population at the start of the simulation
+    """
+    if not np.allclose(totals, expected):
+        raise AssertionError(f"Population is not conserved: {totals} != {expected}")
+
+
 def deriv_simple(beta_o, beta_m, sus_o, sus_m, inf_o, inf_m, k, counts=False, N=None):
     """
     Calculate the *change* in population for all six compartments in the scenario
@@ -102,7 +116,7 @@ def deriv_with_homophily(
     - di_m : infected (misinformed)
     - dr_m : recovered (misinformed)
     """
-    if not (0.5 <= np.round(alpha, 2) <= 1):
+    if not np.all((0.5 <= np.round(alpha, 2)) & (np.round(alpha, 2) <= 1)):
         raise ValueError(f"`alpha` must fall in the range [.5,1]. Alpha = {alpha}")
 
     if not counts:
@@ -137,6 +151,185 @@ def deriv_with_homophily(
     return ds_o, di_o, dr_o, ds_m, di_m, dr_m
 
 
+def two_group_mixing(w_homophily=False, alpha=None):
+    """
+    Return the 2x2 mixing matrix (ordinary, misinformed) that makes `deriv_k_groups`
+    reproduce `deriv_simple` (w_homophily = False) or `deriv_with_homophily`.
+
+    Parameters:
+    -----------
+    - w_homophily (bool) : if True, use homophily `alpha`
+    - alpha (float) : level of homophily. Must fall in range: .5 <= alpha <= 1
+    """
+    if not w_homophily:
+        return np.ones((2, 2))
+    if not (0.5 <= np.round(alpha, 2) <= 1):
+        raise ValueError(f"`alpha` must fall in the range [.5,1]. Alpha = {alpha}")
+    return 2 * np.array([[alpha, 1 - alpha], [1 - alpha, alpha]])
+
+
+# Parameters with respect to which `run_simulation_batch` can compute sensitivities
+SENSITIVITY_PARAMS = ["beta_ord", "beta_mult", "alpha", "frac_ord"]
+
+
+def deriv_sensitivities(
+    state, sens, betas, d_betas, k, mixing, d_mixing, counts=False, N=None
+):
+    """
+    Calculate the *change* in the sensitivities (derivatives of the six
+    compartments with respect to the parameters) of the two-group model, given its
+    state. This is the derivative of the model's change (see `deriv_simple` and
+    `deriv_with_homophily`), where new infections in group g are
+    betas[g] * S[g] * sum_h mixing[g, h] * I[h] (divided by N with `counts`).
+
+    Parameters:
+    -----------
+    - state (np.ndarray) : (n, 6) states. Compartments are ordered as S_o, S_m,
+        I_o, I_m, R_o, R_m
+    - sens (np.ndarray) : (n, p, 6) derivatives of the states with respect to p
+        parameters
+    - betas (np.ndarray) : (n, 2) betas (ordinary, misinformed)
+    - d_betas (np.ndarray) : (n, p, 2) derivatives of the betas
+    - k (np.ndarray) : (n,) rates of recovery
+    - mixing (np.ndarray) : (n, 2, 2) mixing matrices (see `two_group_mixing`)
+    - d_mixing (np.ndarray) : (n, p, 2, 2) derivatives of the mixing matrices
+    - counts (bool) : if True, run the simulation based on a number of people
+    - N (int) : size of the population to run with `counts`
+
+    Returns
+    -----------
+    - d_sens (np.ndarray) : (n, p, 6) change of the sensitivities
+    """
+    scale = N if counts else 1
+    sus = state[:, None, 0:2]
+    d_sus, d_inf = sens[..., 0:2], sens[..., 2:4]
+    betas = betas[:, None]
+
+    force = np.einsum("ngh,nh->ng", mixing, state[:, 2:4])[:, None]
+    d_force = np.einsum("ngh,nph->npg", mixing, d_inf) + np.einsum(
+        "npgh,nh->npg", d_mixing, state[:, 2:4]
+    )
+
+    # Product rule on betas * sus * force
+    d_new_infections = (
+        d_betas * sus * force + betas * d_sus * force + betas * sus * d_force
+    ) / scale
+    d_recoveries = k[:, None, None] * d_inf
+    return np.concatenate(
+        [-d_new_infections, d_new_infections - d_recoveries, d_recoveries], axis=-1
+    )
+
+
+def deriv_k_groups(betas, sus, inf, k, mixing, counts=False, N=None):
+    """
+    Calculate the *change* in population for the S, I and R compartments of k
+    groups that mix according to a contact (mixing) matrix. The force of infection
+    on group g is betas[g] * sum_h mixing[g, h] * inf[h], i.e., one matrix-vector
+    product per step.
+
+    `deriv_simple` and `deriv_with_homophily` are the special case of two groups
+    (ordinary, misinformed) with the mixing matrix from `two_group_mixing`.
+
+    Parameters:
+    -----------
+    - betas (np.ndarray) : (k,) or (n, k) probability of disease transmission of
+        each group
+    - sus (np.ndarray) : (k,) or (n, k) proportion of the population susceptible
+        in each group
+    - inf (np.ndarray) : (k,) or (n, k) proportion of the population infected
+        in each group
+    - k (float/np.ndarray) : the rate of recovery (i.e., 1 / num days to recover).
+        A scalar or an (n, 1) array
+    - mixing (np.ndarray) : (k, k) mixing matrix, or (n, k, k) for one matrix
+        per parameter setting
+    - counts (bool) : if True, run the simulation based on a number of people
+    - N (int) : size of the population to run with `counts`
+
+    Returns
+    -----------
+    The *change* in the population (same shape as `sus`) for...
+    - ds : susceptible
+    - di : infected
+    - dr : recovered
+    """
+    if counts and N is None:
+        raise ValueError("`N` must be set with `counts = True`")
+
+    mixing = np.asarray(mixing)
+    if mixing.ndim == 2:
+        force = inf @ mixing.T
+    else:
+        force = np.matmul(mixing, inf[..., None])[..., 0]
+
+    new_infections = betas * sus * force
+    if counts:
+        new_infections = new_infections / N
+
+    ds = -new_infections
+    di = new_infections - k * inf
+    dr = k * inf
+    return ds, di, dr
+
+
+def run_k_group_simulation(
+    initial_sus,
+    initial_inf,
+    num_days,
+    betas,
+    recovery_days,
+    mixing,
+    counts=False,
+    N=None,
+    validate=False,
+):
+    """
+    Run an SIR simulation of k groups mixing according to `mixing` for the
+    indicated number of days (forward Euler, step size of one day, like
+    `run_simulation`).
+
+    Parameters:
+    -----------
+    - initial_sus (np.ndarray) : (k,) or (n, k) initial susceptible proportions
+    - initial_inf (np.ndarray) : (k,) or (n, k) initial infected proportions
+    - num_days (int) : the number of days to run the simulation for
+    - betas (np.ndarray) : (k,) or (n, k) probability of disease transmission of
+        each group. Used as given: like `run_simulation`, which only caps the
+        misinformed rate (beta_ord * beta_mult) at 1, any cap is up to the caller
+    - recovery_days (float/np.ndarray) : the number of days it takes for individuals
+        to recover. A scalar or an (n,) array
+    - mixing (np.ndarray) : (k, k) or (n, k, k) mixing matrix, see `deriv_k_groups`
+    - counts (bool) : if True, run the simulation based on a number of people
+    - N (int) : size of the population to run with `counts`
+    - validate (bool) : if True, check that the total population is conserved
+
+    Returns
+    -----------
+    - S, I, R (np.ndarray) : (num_days,) + initial_sus.shape arrays
+    """
+    S_0 = np.asarray(initial_sus, dtype=float)
+    I_0 = np.asarray(initial_inf, dtype=float)
+    betas = np.asarray(betas, dtype=float)
+    k = 1 / np.asarray(recovery_days, dtype=float)
+    if k.ndim == 1:
+        k = k[:, None]
+
+    S = np.zeros((num_days,) + S_0.shape)
+    I = np.zeros((num_days,) + S_0.shape)
+    R = np.zeros((num_days,) + S_0.shape)
+    S[0], I[0] = S_0, I_0
+
+    for t in range(0, num_days - 1):
+        ds, di, dr = deriv_k_groups(betas, S[t], I[t], k, mixing, counts=counts, N=N)
+        S[t + 1] = S[t] + ds
+        I[t + 1] = I[t] + di
+        R[t + 1] = R[t] + dr
+
+    if validate:
+        check_conservation((S + I + R).sum(axis=-1), (S_0 + I_0).sum(axis=-1))
+
+    return S, I, R
+
+
 def run_simulation(
     frac_ord,
     prop_infec,
@@ -149,6 +342,12 @@ def run_simulation(
     mixed=False,
     counts=False,
     N=None,
+    method="euler",
+    rtol=1e-6,
+    atol=1e-9,
+    validate=False,
+    check_every=None,
+    sensitivities=False,
 ):
     """
     Run an SIR simulation for the indicated number of days based on the
@@ -170,7 +369,54 @@ def run_simulation(
     - mixed (bool)   : whether to mix initially infected between both the misinformed and ordinary
     - counts (bool)  : if True, run the simulation based on a number of people
     - N (int)        : size of the population to run with `counts`
+    - method (str)   : integration method. Options:
+        - "euler" : forward Euler with a step size of one day (default)
+        - "rk45" : adaptive Runge-Kutta (Dormand-Prince 5(4)) with error control,
+            sampled at each day. See `integrate_rk45`
+    - rtol (float)   : relative tolerance, only used with method = "rk45"
+    - atol (float)   : absolute tolerance, only used with method = "rk45"
+    - validate (bool) : if True, check that the total population is conserved over
+        the whole trajectory (see `check_conservation`). Off by default to keep
+        the integration loop bare
+    - check_every (int) : with `validate`, also check the total population every
+        `check_every` steps while integrating (only with method = "euler")
+    - sensitivities (bool) : if True, also return the derivatives of all
+        compartments with respect to SENSITIVITY_PARAMS (see
+        `run_simulation_batch`), as a {parameter name : six (num_days,) arrays}
+        dict
     """
+    if method != "euler" or sensitivities:
+        results = run_simulation_batch(
+            frac_ord,
+            prop_infec,
+            num_days,
+            beta_ord,
+            recovery_days,
+            beta_mult,
+            w_homophily,
+            alpha,
+            mixed=mixed,
+            counts=counts,
+            N=N,
+            method=method,
+            rtol=rtol,
+            atol=atol,
+            validate=validate,
+            check_every=check_every,
+            sensitivities=sensitivities,
+        )
+        compartments, r0s = results[:6], results[6]
+        single = (
+            *(values[0] for values in compartments),
+            tuple(float(r0[0]) for r0 in r0s),
+        )
+        if not sensitivities:
+            return single
+        sens = {
+            name: tuple(values[0] for values in d_compartments)
+            for name, d_compartments in results[7].items()
+        }
+        return (*single, sens)
 
     eps = prop_infec
     x = frac_ord
@@ -250,11 +496,6 @@ def run_simulation(
                 N=N,
             )
 
-        # Ensure that the total change is zero because individuals should
-        # simply be shifting between compartments
-        total_change = d_s_o + d_s_m + d_i_o + d_i_m + d_r_o + d_r_m
-        assert np.allclose(total_change, 0), f"{total_change}"
-
         # Set the next value as the current plus it's change
         S_o[t + 1] = S_o[t] + d_s_o
         S_m[t + 1] = S_m[t] + d_s_m
@@ -263,4 +504,838 @@ def run_simulation(
         R_o[t + 1] = R_o[t] + d_r_o
         R_m[t + 1] = R_m[t] + d_r_m
 
+        if validate and check_every and (t + 1) % check_every == 0:
+            check_conservation(
+                S_o[t + 1]
+                + S_m[t + 1]
+                + I_o[t + 1]
+                + I_m[t + 1]
+                + R_o[t + 1]
+                + R_m[t + 1],
+                S_o[0] + S_m[0] + I_o[0] + I_m[0],
+            )
+
+    if validate:
+        check_conservation(
+            S_o + S_m + I_o + I_m + R_o + R_m, S_o[0] + S_m[0] + I_o[0] + I_m[0]
+        )
+
     return S_o, S_m, I_o, I_m, R_o, R_m, r0s
+
+
+def broadcast_params(
+    frac_ord, prop_infec, beta_ord, recovery_days, beta_mult, w_homophily, alpha
+):
+    """
+    Broadcast the parameters of a batch of simulations (see `run_simulation_batch`)
+    against each other and flatten them into (n_params,) float arrays, returned in
+    the same order. `alpha` is 0.5 if `w_homophily` is False.
+    """
+    if not w_homophily or alpha is None:
+        alpha = 0.5
+    return tuple(
+        np.ravel(param).astype(float)
+        for param in np.broadcast_arrays(
+            frac_ord, prop_infec, beta_ord, recovery_days, beta_mult, alpha
+        )
+    )
+
+
+def setup_batch(
+    frac_ord,
+    prop_infec,
+    beta_ord,
+    recovery_days,
+    beta_mult,
+    w_homophily,
+    alpha,
+    mixed=False,
+):
+    """
+    Broadcast the parameters of a batch of simulations (see `run_simulation_batch`)
+    and set up their initial conditions.
+
+    Returns
+    -----------
+    - initial (np.ndarray) : (n_params, 6) initial states. Compartments are
+        ordered as S_o, S_m, I_o, I_m, R_o, R_m
+    - B_o, B_m, k, alpha (np.ndarray) : (n_params,) betas (ordinary, misinformed),
+        recovery rates and homophily (0.5 if `w_homophily` is False)
+    - r0s (tuple) : (ord_r0, mis_r0, weighted_avg_r0), each an (n_params,) array
+    """
+    x, eps, B_o, rec_days, mult, alpha = broadcast_params(
+        frac_ord, prop_infec, beta_ord, recovery_days, beta_mult, w_homophily, alpha
+    )
+    num_params = len(x)
+
+    # Compartments are stored in this order along the last axis
+    #   0: S_o, 1: S_m, 2: I_o, 3: I_m, 4: R_o, 5: R_m
+    initial = np.zeros((num_params, 6))
+
+    ### Set up the initial conditions
+    # If mixed, infect both groups equally
+    if mixed:
+        initial[:, 0] = x - (eps / 2)
+        initial[:, 1] = 1 - x - (eps / 2)
+        initial[:, 2] = eps / 2
+        initial[:, 3] = eps / 2
+
+    # Otherwise we only infect one group: the ordinary group if we only have
+    # ordinary folks, the misinformed group otherwise
+    else:
+        only_ord = x == 1
+        initial[:, 0] = np.where(only_ord, x - eps, x)
+        initial[:, 1] = np.where(only_ord, 0, 1 - x - eps)
+        initial[:, 2] = np.where(only_ord, eps, 0)
+        initial[:, 3] = np.where(only_ord, 0, eps)
+
+    # Set recovery rate
+    k = 1 / rec_days
+
+    # Setting beta values
+    B_m = np.minimum(B_o * mult, 1)
+
+    # Get r0 values
+    ord_r0 = B_o / k
+    mis_r0 = B_m / k
+    weighted_avg_r0 = x * ord_r0 + (1 - x) * mis_r0
+
+    r0s = (ord_r0, mis_r0, weighted_avg_r0)
+
+    return initial, B_o, B_m, k, alpha, r0s
+
+
+def run_simulation_batch(
+    frac_ord,
+    prop_infec,
+    num_days,
+    beta_ord,
+    recovery_days,
+    beta_mult,
+    w_homophily,
+    alpha,
+    mixed=False,
+    counts=False,
+    N=None,
+    method="euler",
+    rtol=1e-6,
+    atol=1e-9,
+    validate=False,
+    check_every=None,
+    sensitivities=False,
+):
+    """
+    Run many SIR simulations at once. Same model as `run_simulation`, but all
+    parameter settings are advanced together with array operations.
+
+    Parameters:
+    -----------
+    Same as `run_simulation`, except that `frac_ord`, `prop_infec`, `beta_ord`,
+    `recovery_days`, `beta_mult` and `alpha` can be arrays. They are broadcast
+    against each other and flattened into n_params parameter settings.
+    `alpha` is ignored (and can be None) if `w_homophily` is False.
+    With method = "rk45", every parameter setting gets its own adaptive step size.
+    - sensitivities (bool) : if True, also integrate the forward sensitivity
+        equations (see `deriv_sensitivities`) along with the state, to get the
+        derivatives of all compartments with respect to SENSITIVITY_PARAMS. With
+        method = "euler", these are the exact derivatives of the simulated values
+
+    Returns
+    -----------
+    - S_o, S_m, I_o, I_m, R_o, R_m (np.ndarray) : (n_params, num_days) arrays,
+        one row per parameter setting
+    - r0s (tuple) : (ord_r0, mis_r0, weighted_avg_r0), each an (n_params,) array
+    - sens (dict) : only if `sensitivities` is True.
+        {parameter name : (dS_o, dS_m, dI_o, dI_m, dR_o, dR_m)}, the derivatives
+        of each compartment with respect to the parameter, each an
+        (n_params, num_days) array. E.g., the derivative of the final size with
+        respect to lambda is
+        sens["beta_mult"][4][:, -1] + sens["beta_mult"][5][:, -1]
+    """
+    x, _, _, _, mult, _ = broadcast_params(
+        frac_ord, prop_infec, beta_ord, recovery_days, beta_mult, w_homophily, alpha
+    )
+    initial, B_o, B_m, k, alpha, r0s = setup_batch(
+        frac_ord,
+        prop_infec,
+        beta_ord,
+        recovery_days,
+        beta_mult,
+        w_homophily,
+        alpha,
+        mixed,
+    )
+    num_params = len(initial)
+
+    def derivatives(state, idx=slice(None)):
+        """
+        Return the (n, 6) change of `state`, the (n, 6) states of the parameter
+        settings selected by `idx`.
+        """
+        if w_homophily:
+            changes = deriv_with_homophily(
+                beta_o=B_o[idx],
+                beta_m=B_m[idx],
+                sus_o=state[:, 0],
+                sus_m=state[:, 1],
+                inf_o=state[:, 2],
+                inf_m=state[:, 3],
+                k=k[idx],
+                alpha=alpha[idx],
+                counts=counts,
+                N=N,
+            )
+        else:
+            changes = deriv_simple(
+                beta_o=B_o[idx],
+                beta_m=B_m[idx],
+                sus_o=state[:, 0],
+                sus_m=state[:, 1],
+                inf_o=state[:, 2],
+                inf_m=state[:, 3],
+                k=k[idx],
+                counts=counts,
+                N=N,
+            )
+        d_s_o, d_i_o, d_r_o, d_s_m, d_i_m, d_r_m = changes
+        return np.stack([d_s_o, d_s_m, d_i_o, d_i_m, d_r_o, d_r_m], axis=1)
+
+    # The states of the simulations (n_params, 6) are extended with their
+    # sensitivities (n_params, num_sens * 6), which are integrated together
+    start = initial
+    step = derivatives
+    if sensitivities:
+        num_sens = len(SENSITIVITY_PARAMS)
+        betas = np.stack([B_o, B_m], axis=1)
+        d_betas, mixing, d_mixing, d_initial = setup_sensitivities(
+            x, B_o, mult, alpha, w_homophily, mixed
+        )
+        start = np.concatenate([initial, d_initial.reshape(num_params, -1)], axis=1)
+
+        def step(state, idx=slice(None)):
+            """Return the change of the states and of their sensitivities."""
+            d_sens = deriv_sensitivities(
+                state[:, :6],
+                state[:, 6:].reshape(len(state), num_sens, 6),
+                betas[idx],
+                d_betas[idx],
+                k[idx],
+                mixing[idx],
+                d_mixing[idx],
+                counts=counts,
+                N=N,
+            )
+            return np.concatenate(
+                [derivatives(state[:, :6], idx), d_sens.reshape(len(state), -1)],
+                axis=1,
+            )
+
+    if method == "euler":
+        step_size = 1  # step size
+        all_steps = np.arange(0, num_days, step_size)
+        states = np.zeros((len(all_steps),) + start.shape)
+        states[0] = start
+
+        for t in range(0, len(all_steps) - 1):
+            # Calculate the change of each value for all settings at once
+            change = step(states[t])
+
+            # Set the next value as the current plus it's change
+            states[t + 1] = states[t] + change
+
+            if validate and check_every and (t + 1) % check_every == 0:
+                check_conservation(
+                    states[t + 1, :, :6].sum(axis=1), initial.sum(axis=1)
+                )
+
+    elif method == "rk45":
+        states = integrate_rk45(step, start, num_days, rtol=rtol, atol=atol)
+
+    else:
+        raise ValueError(f"`method` must be 'euler' or 'rk45'. Method = {method}")
+
+    if validate:
+        check_conservation(states[..., :6].sum(axis=2), initial.sum(axis=1))
+
+    S_o, S_m, I_o, I_m, R_o, R_m = np.moveaxis(states[..., :6], (0, 1, 2), (2, 1, 0))
+    if not sensitivities:
+        return S_o, S_m, I_o, I_m, R_o, R_m, r0s
+
+    sens = np.moveaxis(
+        states[..., 6:].reshape(len(states), num_params, num_sens, 6), 0, -1
+    )
+    sens = {
+        name: tuple(sens[:, pos, compartment] for compartment in range(6))
+        for pos, name in enumerate(SENSITIVITY_PARAMS)
+    }
+    return S_o, S_m, I_o, I_m, R_o, R_m, r0s, sens
+
+
+def setup_sensitivities(frac_ord, beta_ord, beta_mult, alpha, w_homophily, mixed):
+    """
+    Set up the quantities needed to integrate the sensitivities of a batch of
+    simulations (see `run_simulation_batch` and `deriv_sensitivities`) with
+    respect to SENSITIVITY_PARAMS.
+
+    Parameters:
+    -----------
+    - frac_ord, beta_ord, beta_mult, alpha (np.ndarray) : (n_params,) parameters,
+        see `broadcast_params`
+    - w_homophily (bool) : if True, `alpha` sets the mixing
+    - mixed (bool) : whether the initially infected are split between both groups
+
+    Returns
+    -----------
+    - d_betas (np.ndarray) : (n_params, num_sens, 2) derivatives of the betas
+    - mixing (np.ndarray) : (n_params, 2, 2) mixing matrices
+    - d_mixing (np.ndarray) : (n_params, num_sens, 2, 2) derivatives of the
+        mixing matrices
+    - d_initial (np.ndarray) : (n_params, num_sens, 6) derivatives of the
+        initial states
+    """
+    num_params = len(frac_ord)
+    num_sens = len(SENSITIVITY_PARAMS)
+    sens_pos = {name: pos for pos, name in enumerate(SENSITIVITY_PARAMS)}
+
+    # beta_misinformed = min(beta_ord * lambda, 1): its derivatives are 0 once it
+    # is capped
+    uncapped = beta_ord * beta_mult < 1
+    d_betas = np.zeros((num_params, num_sens, 2))
+    d_betas[:, sens_pos["beta_ord"], 0] = 1
+    d_betas[:, sens_pos["beta_ord"], 1] = np.where(uncapped, beta_mult, 0)
+    d_betas[:, sens_pos["beta_mult"], 1] = np.where(uncapped, beta_ord, 0)
+
+    mixing = np.stack([two_group_mixing(w_homophily, a) for a in alpha])
+    d_mixing = np.zeros((num_params, num_sens, 2, 2))
+    if w_homophily:
+        d_mixing[:, sens_pos["alpha"]] = 2 * np.array([[1, -1], [-1, 1]])
+
+    # frac_ord moves people from the misinformed to the ordinary susceptibles
+    # (without mixing, there are no misinformed if frac_ord = 1)
+    d_initial = np.zeros((num_params, num_sens, 6))
+    d_initial[:, sens_pos["frac_ord"], 0] = 1
+    only_ord = np.logical_and(not mixed, frac_ord == 1)
+    d_initial[:, sens_pos["frac_ord"], 1] = np.where(only_ord, 0, -1)
+
+    return d_betas, mixing, d_mixing, d_initial
+
+
+# Dormand-Prince 5(4) coefficients (see Hairer, Norsett & Wanner, Solving Ordinary
+# Differential Equations I) and the coefficients of its 4th order dense output
+RK45_C = np.array([0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1])
+RK45_A = [
+    np.array([]),
+    np.array([1 / 5]),
+    np.array([3 / 40, 9 / 40]),
+    np.array([44 / 45, -56 / 15, 32 / 9]),
+    np.array([19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729]),
+    np.array([9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656]),
+]
+RK45_B = np.array([35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84])
+RK45_E = np.array(
+    [-71 / 57600, 0, 71 / 16695, -71 / 1920, 17253 / 339200, -22 / 525, 1 / 40]
+)
+RK45_P = np.array(
+    [
+        [
+            1,
+            -8048581381 / 2820520608,
+            8663915743 / 2820520608,
+            -12715105075 / 11282082432,
+        ],
+        [0, 0, 0, 0],
+        [
+            0,
+            131558114200 / 32700410799,
+            -68118460800 / 10900136933,
+            87487479700 / 32700410799,
+        ],
+        [
+            0,
+            -1754552775 / 470086768,
+            14199869525 / 1410260304,
+            -10690763975 / 1880347072,
+        ],
+        [
+            0,
+            127303824393 / 49829197408,
+            -318862633887 / 49829197408,
+            701980252875 / 199316789632,
+        ],
+        [0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844],
+        [0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423],
+    ]
+)
+
+
+def integrate_rk45(
+    derivatives, initial, num_days, rtol=1e-6, atol=1e-9, max_steps=100000
+):
+    """
+    Integrate a batch of ODE systems with an adaptive Dormand-Prince 5(4)
+    Runge-Kutta method and sample the solutions at days 0, 1, ..., num_days - 1.
+
+    Each system has its own step size, chosen so that the estimated local error
+    stays below `atol + rtol * |state|` (for each compartment). Values at integer
+    days are computed with the method's 4th order dense output, so the step size
+    does not depend on the sampling.
+
+    Parameters:
+    -----------
+    - derivatives (function) : derivatives(state, idx) returns the (n, d) time
+        derivatives of the (n, d) states of the systems selected by the index
+        array `idx`
+    - initial (np.ndarray) : (n_systems, d) initial states
+    - num_days (int) : number of days to sample (the first one is `initial`)
+    - rtol (float) : relative tolerance
+    - atol (float) : absolute tolerance
+    - max_steps (int) : maximum number of steps (accepted or rejected)
+
+    Returns
+    -----------
+    - states (np.ndarray) : (num_days, n_systems, d) array of states
+    """
+    num_systems = len(initial)
+    t_end = num_days - 1
+    states = np.zeros((num_days,) + initial.shape)
+    states[0] = initial
+    if t_end <= 0 or num_systems == 0:
+        return states
+
+    everyone = np.arange(num_systems)
+    y = initial.astype(float)
+    f = derivatives(y, everyone)
+    t = np.zeros(num_systems)
+    next_day = np.ones(num_systems, dtype=int)
+
+    # Initial step size, based on the scale of the state and its derivatives
+    scale = atol + rtol * np.abs(y)
+    d0 = np.sqrt(np.mean((y / scale) ** 2, axis=1))
+    d1 = np.sqrt(np.mean((f / scale) ** 2, axis=1))
+    h = np.where((d0 < 1e-5) | (d1 < 1e-5), 1e-6, 0.01 * d0 / np.maximum(d1, 1e-300))
+    h = np.minimum(h, t_end)
+
+    for _ in range(max_steps):
+        active = np.flatnonzero(t < t_end)
+        if len(active) == 0:
+            return states
+
+        y_a, f_a, t_a = y[active], f[active], t[active]
+        h_a = np.minimum(h[active], t_end - t_a)[:, None]
+
+        # Stages
+        K = [f_a]
+        for c, a in zip(RK45_C[1:], RK45_A[1:]):
+            dy = sum(a_j * K_j for a_j, K_j in zip(a, K))
+            K.append(derivatives(y_a + h_a * dy, active))
+        y_new = y_a + h_a * sum(b * K_j for b, K_j in zip(RK45_B, K))
+        f_new = derivatives(y_new, active)
+        K.append(f_new)
+
+        # Error control
+        error = h_a * sum(e * K_j for e, K_j in zip(RK45_E, K))
+        scale = atol + rtol * np.maximum(np.abs(y_a), np.abs(y_new))
+        error_norm = np.sqrt(np.mean((error / scale) ** 2, axis=1))
+        accepted = error_norm <= 1
+
+        with np.errstate(divide="ignore"):
+            factor = 0.9 * error_norm ** (-1 / 5)
+        factor = np.where(accepted, np.clip(factor, 0.2, 10), np.clip(factor, 0.2, 1))
+        h[active] = h_a[:, 0] * factor
+
+        # Sample the accepted steps at the days they cover, with the dense output
+        #   y(t + theta * h) = y + h * Q @ [theta, theta^2, theta^3, theta^4]
+        t_new = t_a + h_a[:, 0]
+        Q = np.einsum("snd,sp->ndp", np.stack(K), RK45_P)
+        pending = accepted & (next_day[active] <= t_new + 1e-12)
+        while pending.any():
+            rows = np.flatnonzero(pending)
+            systems = active[rows]
+            days = next_day[systems]
+            theta = (days - t_a[rows]) / h_a[rows, 0]
+            powers = theta[:, None] ** np.arange(1, 5)
+            states[days, systems] = y_a[rows] + h_a[rows] * np.einsum(
+                "rdp,rp->rd", Q[rows], powers
+            )
+            next_day[systems] += 1
+            pending[rows] = next_day[systems] <= t_new[rows] + 1e-12
+
+        # Move the accepted systems forward
+        accepted_systems = active[accepted]
+        t[accepted_systems] = np.where(
+            t_end - t_new[accepted] < 1e-12, t_end, t_new[accepted]
+        )
+        y[accepted_systems] = y_new[accepted]
+        f[accepted_systems] = f_new[accepted]
+
+    raise RuntimeError(f"Integration did not finish within {max_steps} steps.")
+
+
+def final_size(
+    frac_ord,
+    prop_infec,
+    beta_ord,
+    recovery_days,
+    beta_mult,
+    w_homophily,
+    alpha,
+    mixed=False,
+    counts=False,
+    N=None,
+    tol=1e-12,
+    max_iter=100,
+    check=False,
+    check_days=2000,
+    check_tol=1e-4,
+):
+    """
+    Solve for the final epidemic size (R_o and R_m as t -> infinity) of the
+    two-group SIR model directly, without simulating the epidemic.
+
+    Integrating dS/S over time gives, for each group g in (o, m) with size
+    n_g = S_g(0) + I_g(0) + R_g(0):
+        S_g(inf) = S_g(0) * exp(-sum_h a_gh * (n_h - S_h(inf) - R_h(0)))
+    where a_gh = c * beta_g * w_gh / k (divided by N with `counts`), w is the
+    mixing matrix [[alpha, 1 - alpha], [1 - alpha, alpha]] and c = 2 (with
+    homophily) or c = 1 and w = all ones (without). This system is solved with a
+    vectorised Newton iteration started at S(inf) = 0. Since the system is
+    monotone, the iterates increase towards the (epidemic) root without
+    overshooting it. Groups that cannot be reached by the infection (no initial
+    infected in the group, nor in any group that can infect it) are not part of
+    the epidemic: their S(inf) is pinned to S(0), otherwise the iteration would
+    converge to an epidemic that never starts.
+
+    Parameters:
+    -----------
+    Same as `run_simulation_batch` (without `num_days`) and...
+    - tol (float) : stop when all Newton updates are smaller than `tol`
+    - max_iter (int) : maximum number of Newton iterations
+    - check (bool) : if True, cross-check the result against the time-stepped
+        solver (method = "rk45", run for `check_days` days)
+    - check_days (int) : number of days simulated by the cross-check
+    - check_tol (float) : maximum difference allowed by the cross-check
+
+    Returns
+    -----------
+    - R_o, R_m (np.ndarray) : (n_params,) final number (or proportion) of
+        recovered individuals in the ordinary and misinformed groups
+    """
+    initial, B_o, B_m, k, alpha_flat, _ = setup_batch(
+        frac_ord,
+        prop_infec,
+        beta_ord,
+        recovery_days,
+        beta_mult,
+        w_homophily,
+        alpha,
+        mixed,
+    )
+    if counts and N is None:
+        raise ValueError("`N` must be set with `counts = True`")
+    scale = N if counts else 1
+
+    # Mixing matrices, shape (n_params, 2, 2)
+    if w_homophily:
+        mixing = 2 * np.stack(
+            [
+                np.stack([alpha_flat, 1 - alpha_flat], axis=1),
+                np.stack([1 - alpha_flat, alpha_flat], axis=1),
+            ],
+            axis=1,
+        )
+    else:
+        mixing = np.ones((len(initial), 2, 2))
+    A = mixing * (np.stack([B_o, B_m], axis=1) / (k * scale)[:, None])[:, :, None]
+
+    S_0 = initial[:, [0, 1]]
+    R_0 = initial[:, [4, 5]]
+    sizes = initial[:, [0, 1]] + initial[:, [2, 3]] + R_0
+
+    # Groups reached by the infection: seeded groups and, repeatedly, the groups
+    # they can infect
+    reached = initial[:, [2, 3]] != 0
+    for _ in range(reached.shape[1] - 1):
+        reached |= np.einsum("ngh,nh->ng", A != 0, reached) > 0
+
+    S_inf = np.where(reached, 0, S_0)
+    for _ in range(max_iter):
+        exponential = S_0 * np.exp(-np.einsum("ngh,nh->ng", A, sizes - S_inf - R_0))
+        # Rows of the groups that are not reached keep them at S(0)
+        F = np.where(reached, S_inf - exponential, 0)
+        J = np.where(
+            reached[:, :, None], np.eye(2) - exponential[:, :, None] * A, np.eye(2)
+        )
+        update = np.linalg.solve(J, F[:, :, None])[:, :, 0]
+        S_inf = np.clip(S_inf - update, np.minimum(S_0, 0), np.maximum(S_0, 0))
+        if np.all(np.abs(update) < tol):
+            break
+
+    R_o, R_m = (sizes - S_inf).T
+
+    if check:
+        *_, R_o_sim, R_m_sim, _ = run_simulation_batch(
+            frac_ord,
+            prop_infec,
+            check_days,
+            beta_ord,
+            recovery_days,
+            beta_mult,
+            w_homophily,
+            alpha,
+            mixed=mixed,
+            counts=counts,
+            N=N,
+            method="rk45",
+        )
+        difference = max(
+            np.max(np.abs(R_o - R_o_sim[:, -1]), initial=0),
+            np.max(np.abs(R_m - R_m_sim[:, -1]), initial=0),
+        )
+        if difference > check_tol * scale:
+            raise AssertionError(
+                f"Final size differs from the simulated one by {difference}"
+            )
+
+    return R_o, R_m
+
+
+# Change of (S_o, S_m, I_o, I_m, R_o, R_m) caused by each stochastic event:
+#   0: infection (ordinary), 1: infection (misinformed),
+#   2: recovery (ordinary), 3: recovery (misinformed)
+EVENTS = np.array(
+    [
+        [-1, 0, 1, 0, 0, 0],
+        [0, -1, 0, 1, 0, 0],
+        [0, 0, -1, 0, 1, 0],
+        [0, 0, 0, -1, 0, 1],
+    ]
+)
+
+
+def run_stochastic_simulation(
+    frac_ord,
+    prop_infec,
+    num_days,
+    beta_ord,
+    recovery_days,
+    beta_mult,
+    w_homophily,
+    alpha,
+    N,
+    num_replicates=1000,
+    mixed=False,
+    method="chain_binomial",
+    steps_per_day=1,
+    seed=None,
+):
+    """
+    Run many replicates of a stochastic version of the two-group SIR model for a
+    finite population of `N` people. All replicates are advanced together.
+
+    Individuals get infected at rate beta_g * sum_h w_gh * I_h / N (the mixing w
+    is the one of `two_group_mixing`, so the expected dynamics are those of
+    `run_simulation` with counts) and recover at rate 1 / recovery_days. Unlike
+    the deterministic model, the infection can die out by chance, especially
+    early on when only a few people are infected.
+
+    Parameters:
+    -----------
+    Same as `run_simulation` (for a single parameter setting) and...
+    - N (int) : size of the population. The ordinary group has round(frac_ord * N)
+        people and max(1, round(prop_infec * N)) people are initially infected
+        (none if prop_infec = 0). With `mixed`, the infected are split as evenly
+        as possible between the groups (the extra one goes to the ordinary
+        group, and seeds that do not fit in a group go to the other one)
+    - num_replicates (int) : number of independent replicates
+    - method (str) : simulation method. Options:
+        - "chain_binomial" : each step, the number of new infections and of
+            recoveries in each group are drawn from binomial distributions with
+            probabilities 1 - exp(-rate * step) (default)
+        - "gillespie" : exact simulation of every single event (Gillespie's
+            direct method). The number of iterations grows with `N`
+    - steps_per_day (int) : number of chain binomial steps per day
+    - seed (int) : seed of the random number generator
+
+    Returns
+    -----------
+    - S_o, S_m, I_o, I_m, R_o, R_m (np.ndarray) : (num_replicates, num_days)
+        numbers of people, one row per replicate
+    - r0s (tuple) : (ord_r0, mis_r0, weighted_avg_r0)
+    """
+    initial, B_o, B_m, k, alpha, r0s = setup_batch(
+        frac_ord,
+        prop_infec,
+        beta_ord,
+        recovery_days,
+        beta_mult,
+        w_homophily,
+        alpha,
+        mixed,
+    )
+    if len(initial) != 1:
+        raise ValueError("Stochastic simulations take a single parameter setting.")
+    initial = stochastic_initial_counts(frac_ord, prop_infec, N, mixed)
+    betas = np.array([B_o[0], B_m[0]])
+    k = k[0]
+    mixing = two_group_mixing(w_homophily, alpha[0])
+    rng = np.random.default_rng(seed)
+
+    if method == "chain_binomial":
+        states = chain_binomial(
+            initial, num_days, betas, k, mixing, N, num_replicates, steps_per_day, rng
+        )
+    elif method == "gillespie":
+        states = gillespie(initial, num_days, betas, k, mixing, N, num_replicates, rng)
+    else:
+        raise ValueError(
+            f"`method` must be 'chain_binomial' or 'gillespie'. Method = {method}"
+        )
+
+    S_o, S_m, I_o, I_m, R_o, R_m = np.moveaxis(states, (0, 1, 2), (2, 1, 0))
+    return S_o, S_m, I_o, I_m, R_o, R_m, tuple(float(r0[0]) for r0 in r0s)
+
+
+def stochastic_initial_counts(frac_ord, prop_infec, N, mixed=False):
+    """
+    Return the initial numbers of people (S_o, S_m, I_o, I_m, R_o, R_m) of a
+    stochastic simulation (see `run_stochastic_simulation`). They sum to `N`.
+    """
+    if prop_infec > 0 and prop_infec * N < 0.5:
+        raise ValueError(
+            f"`prop_infec` = {prop_infec} rounds to no infected people with N = {N}"
+        )
+    N = int(N)
+    num_ord = int(np.floor(frac_ord * N + 0.5))
+    group_sizes = np.array([num_ord, N - num_ord])
+    num_seeds = max(1, int(np.floor(prop_infec * N + 0.5))) if prop_infec > 0 else 0
+    if num_seeds > N:
+        raise ValueError(f"Cannot infect {num_seeds} people out of N = {N}")
+
+    # Seeds of each group: both (mixed), only the ordinary group if there are
+    # only ordinary folks, the misinformed group otherwise
+    if mixed:
+        seeds_mis = num_seeds // 2
+    elif group_sizes[1] == 0:
+        seeds_mis = 0
+    else:
+        seeds_mis = num_seeds
+    seeds_mis = min(seeds_mis, group_sizes[1])
+    seeds_ord = num_seeds - seeds_mis
+    if seeds_ord > group_sizes[0]:
+        seeds_mis += seeds_ord - group_sizes[0]
+        seeds_ord = group_sizes[0]
+    infected = np.array([seeds_ord, seeds_mis])
+
+    susceptible = group_sizes - infected
+    return np.concatenate([susceptible, infected, [0, 0]]).astype(np.int64)
+
+
+def chain_binomial(
+    initial, num_days, betas, k, mixing, N, num_replicates, steps_per_day, rng
+):
+    """
+    Chain binomial simulation for `run_stochastic_simulation`.
+
+    Returns
+    -----------
+    - states (np.ndarray) : (num_days, num_replicates, 6) numbers of people
+    """
+    step = 1 / steps_per_day
+    state = np.tile(initial, (num_replicates, 1))
+    states = np.zeros((num_days, num_replicates, 6), dtype=np.int64)
+    states[0] = state
+
+    for t in range(0, num_days - 1):
+        for _ in range(steps_per_day):
+            sus, inf = state[:, 0:2], state[:, 2:4]
+            force = betas * (inf @ mixing.T) / N
+            new_infections = rng.binomial(sus, -np.expm1(-force * step))
+            recoveries = rng.binomial(inf, -np.expm1(-k * step))
+            state = state + np.concatenate(
+                [-new_infections, new_infections - recoveries, recoveries], axis=1
+            )
+        states[t + 1] = state
+
+    return states
+
+
+def gillespie(initial, num_days, betas, k, mixing, N, num_replicates, rng):
+    """
+    Gillespie (direct method) simulation for `run_stochastic_simulation`. Each
+    iteration draws the next event of every replicate that is still running, so
+    replicates advance in parallel, each with its own clock.
+
+    Returns
+    -----------
+    - states (np.ndarray) : (num_days, num_replicates, 6) numbers of people
+    """
+    state = np.tile(initial, (num_replicates, 1))
+    states = np.zeros((num_days, num_replicates, 6), dtype=np.int64)
+    recorded = np.zeros((num_days, num_replicates), dtype=bool)
+    states[0] = state
+    recorded[0] = True
+
+    time = np.zeros(num_replicates)
+    next_day = np.ones(num_replicates, dtype=np.int64)
+    running = np.arange(num_replicates)
+
+    while len(running) > 0:
+        current = state[running]
+        sus, inf = current[:, 0:2], current[:, 2:4]
+        rates = np.concatenate([betas * sus * (inf @ mixing.T) / N, k * inf], axis=1)
+        total = rates.sum(axis=1)
+
+        # Time of the next event (never, once there are no more infected)
+        with np.errstate(divide="ignore"):
+            time[running] += rng.exponential(1 / total)
+
+        # The state did not change until the next event, record it for all the
+        # days that passed. Skipped days are filled in at the end
+        passed = running[time[running] >= next_day[running]]
+        days = next_day[passed]
+        in_range = days < num_days
+        states[days[in_range], passed[in_range]] = state[passed[in_range]]
+        recorded[days[in_range], passed[in_range]] = True
+        next_day[passed] = np.minimum(
+            np.floor(np.minimum(time[passed], num_days)) + 1, num_days
+        )
+
+        # Apply the next event of the replicates that are still running
+        going = (total > 0) & (time[running] < num_days - 1)
+        thresholds = rng.random(len(running)) * total
+        events = (np.cumsum(rates, axis=1) <= thresholds[:, None]).sum(axis=1)
+        events = np.minimum(events, len(EVENTS) - 1)
+        state[running[going]] += EVENTS[events[going]]
+        running = running[going]
+
+    # Fill in the skipped days with the last recorded state
+    last_recorded = np.maximum.accumulate(
+        np.where(recorded, np.arange(num_days)[:, None], 0), axis=0
+    )
+    return states[last_recorded, np.arange(num_replicates)]
+
+
+def outbreak_statistics(S_o, S_m, N, threshold=0.01, bins=20):
+    """
+    Summarise replicates of `run_stochastic_simulation`.
+
+    Parameters:
+    -----------
+    - S_o, S_m (np.ndarray) : (num_replicates, num_days) susceptible people
+    - N (int) : size of the population
+    - threshold (float) : a replicate is counted as an outbreak if more than this
+        proportion of the population got infected
+    - bins (int/array) : bins of the final size distribution (see np.histogram)
+
+    Returns
+    -----------
+    - outbreak_probability (float) : proportion of replicates with an outbreak
+    - final_sizes (np.ndarray) : (num_replicates,) proportion of the population
+        infected by the last day (including the initially infected)
+    - distribution (tuple) : (proportion of replicates, bin edges) of the final
+        sizes
+    """
+    final_sizes = 1 - (S_o[:, -1] + S_m[:, -1]) / N
+    outbreak_probability = np.mean(final_sizes > threshold)
+    counts, edges = np.histogram(final_sizes, bins=bins, range=(0, 1))
+    return outbreak_probability, final_sizes, (counts / len(final_sizes), edges)
@@ -0,0 +1,253 @@
+"""
+Declarative parameter sweeps for the mean-field simulations.
+
+A sweep is given as a grid, {parameter name : list of values}, plus the parameters
+that are fixed for all settings. Names are those of `run_simulation_batch`. The
+grid is expanded in nested-loop order (the first parameter varies slowest) and
+split into shards of settings. Each shard is solved with a single call to the
+batched solver, possibly in parallel across processes, and saved to its own .npz
+file as soon as it finishes. Running the same sweep again only solves the
+shards that are missing, so an interrupted sweep resumes where it stopped.
+
+E.g.:
+    >>> results = run_sweep(
+    ...     grid={"beta_ord": [0.1, 0.2, 0.3], "beta_mult": [1, 2, 3]},
+    ...     fixed={"frac_ord": 0.5, "prop_infec": 0.001, "num_days": 100,
+    ...            "recovery_days": 5, "w_homophily": False, "alpha": None,
+    ...            "mixed": True},
+    ...     out_dir="../sim_results/my_sweep",
+    ... )
+    >>> results["beta_ord"], results["I_o"]  # shapes (9,) and (9, 100)
+
+Daily results are saved in the same dense layout with `save_daily`: one
+(n_settings,) column per parameter, one (n_settings, num_days) array per value and
+the days. `long_format` converts them to a (setting, day) row DataFrame, only for
+the settings that are needed, e.g. when plotting:
+    >>> daily = load_daily("../sim_results/my_sweep/daily_infections.npz")
+    >>> long_format(select(daily, {"beta": 0.3}))
+
+Author: Matthew DeVerna
+"""
+
+import concurrent.futures
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from result_cache import cached_run_simulation_batch
+from simulations import run_simulation_batch
+
+COMPARTMENTS = ["S_o", "S_m", "I_o", "I_m", "R_o", "R_m"]
+R0S = ["ord_r0", "mis_r0", "weighted_avg_r0"]
+SPEC_FILE = "sweep.json"
+DAY = "day"
+
+
+def parameter_grid(grid):
+    """
+    Expand a {parameter name : list of values} grid into one flat array per
+    parameter, in nested-loop order (the first parameter varies slowest). Values
+    keep their original type.
+    """
+    names = list(grid)
+    values = np.meshgrid(*(np.asarray(grid[name]) for name in names), indexing="ij")
+    return {name: value.ravel() for name, value in zip(names, values)}
+
+
+def run_shard(settings, fixed, outputs, path, cache_dir=None):
+    """
+    Solve one shard of settings with `run_simulation_batch` and save it to `path`.
+
+    Parameters:
+    -----------
+    - settings (dict) : {parameter name : (n,) array of values}
+    - fixed (dict) : parameters shared by all settings
+    - outputs (list) : compartments (see COMPARTMENTS) to save. The r0s are
+        always saved
+    - path (str) : output file (.npz)
+    - cache_dir (str) : if not None, reuse the results cached in this directory
+        (see `result_cache`)
+    """
+    if cache_dir is None:
+        *compartments, r0s = run_simulation_batch(**fixed, **settings)
+    else:
+        *compartments, r0s = cached_run_simulation_batch(cache_dir, **fixed, **settings)
+    results = dict(zip(COMPARTMENTS, compartments))
+    arrays = {name: results[name] for name in outputs}
+    arrays.update(zip(R0S, r0s))
+    arrays.update(settings)
+
+    # Write to a temporary file first, so that only complete shards exist
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def run_sweep(
+    grid,
+    fixed,
+    out_dir,
+    outputs=COMPARTMENTS,
+    shard_size=1000,
+    num_workers=1,
+    keep_shards=False,
+    cache_dir=None,
+):
+    """
+    Run a parameter sweep with the batched solver.
+
+    Parameters:
+    -----------
+    - grid (dict) : {parameter name : list of values}, see `parameter_grid`
+    - fixed (dict) : parameters shared by all settings (e.g., num_days, mixed)
+    - out_dir (str) : directory where shards are saved while the sweep runs
+    - outputs (list) : compartments (see COMPARTMENTS) to keep
+    - shard_size (int) : number of settings solved by each call to the solver
+    - num_workers (int) : number of processes. 1 = serial
+    - keep_shards (bool) : if False, shards are removed once the sweep is complete
+    - cache_dir (str) : if not None, settings already simulated (by this or any
+        other sweep) are read from the cache in this directory and new results
+        are added to it. See `result_cache`
+
+    Returns
+    -----------
+    - results (dict) : {name : array} with one (n_settings,) array per grid
+        parameter and r0 (see R0S) and one (n_settings, num_days) array per
+        compartment in `outputs`. Rows follow `parameter_grid(grid)`
+    """
+    settings = parameter_grid(grid)
+    num_settings = len(next(iter(settings.values())))
+    shards_dir = os.path.join(out_dir, "shards")
+
+    # Start over if the shards on disk belong to a different sweep
+    spec = json.loads(
+        json.dumps(
+            {
+                "grid": {name: np.asarray(v).tolist() for name, v in grid.items()},
+                "fixed": fixed,
+                "outputs": list(outputs),
+                "shard_size": shard_size,
+            },
+            default=str,
+        )
+    )
+    spec_path = os.path.join(shards_dir, SPEC_FILE)
+    if os.path.exists(spec_path):
+        with open(spec_path, "r") as f:
+            if json.load(f) != spec:
+                print("Parameters changed, discarding previous shards.")
+                shutil.rmtree(shards_dir)
+    os.makedirs(shards_dir, exist_ok=True)
+    with open(spec_path, "w") as f:
+        json.dump(spec, f)
+
+    # Collect the shards that still have to be solved
+    jobs = []
+    paths = []
+    for shard, start in enumerate(range(0, num_settings, shard_size)):
+        path = os.path.join(shards_dir, f"shard_{shard:05d}.npz")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        shard_settings = {
+            name: values[start : start + shard_size]
+            for name, values in settings.items()
+        }
+        jobs.append((shard_settings, fixed, list(outputs), path, cache_dir))
+    print(f"{len(paths) - len(jobs)} shards already solved, {len(jobs)} to solve.")
+
+    if num_workers <= 1:
+        for job in jobs:
+            run_shard(*job)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=num_workers
+        ) as executor:
+            futures = [executor.submit(run_shard, *job) for job in jobs]
+            for future in concurrent.futures.as_completed(futures):
+                # Raise errors from the workers
+                future.result()
+
+    results = load_shards(paths)
+    if not keep_shards:
+        shutil.rmtree(shards_dir)
+    return results
+
+
+def load_shards(paths):
+    """Concatenate the arrays saved in the .npz shards at `paths`."""
+    shards = []
+    for path in paths:
+        with np.load(path) as shard:
+            shards.append({name: shard[name] for name in shard.files})
+    return {
+        name: np.concatenate([shard[name] for shard in shards]) for name in shards[0]
+    }
+
+
+def save_daily(path, columns, values, days):
+    """
+    Save daily results in dense form to a single (compressed) .npz file.
+
+    Parameters:
+    -----------
+    - path (str) : output file (.npz)
+    - columns (dict) : {parameter name : (n_settings,) array}, e.g. {"beta": ...}
+    - values (dict) : {value name : (n_settings, num_days) array}, e.g.
+        {"prop_infected": ...}
+    - days (array-like) : the (num_days,) day of each column of the values
+    """
+    days = np.asarray(days)
+    for name, value in values.items():
+        if np.shape(value)[1] != len(days):
+            raise ValueError(f"`{name}` must have one column per day.")
+    np.savez_compressed(
+        path,
+        **{DAY: days},
+        **{name: np.asarray(column) for name, column in columns.items()},
+        **{name: np.asarray(value) for name, value in values.items()},
+    )
+
+
+def load_daily(path):
+    """Load daily results saved with `save_daily` as a {name : array} dict."""
+    with np.load(path) as daily:
+        return {name: daily[name] for name in daily.files}
+
+
+def select(daily, conditions):
+    """
+    Select the settings of `daily` (see `load_daily`) that match `conditions`, a
+    {parameter name : value or list of values} dict. Values are compared exactly.
+    """
+    num_settings = len(next(array for name, array in daily.items() if name != DAY))
+    keep = np.ones(num_settings, dtype=bool)
+    for name, values in conditions.items():
+        keep &= np.isin(daily[name], values)
+    return {
+        name: (array if name == DAY else array[keep]) for name, array in daily.items()
+    }
+
+
+def long_format(daily):
+    """
+    Convert daily results (see `load_daily`) to a DataFrame with one row per
+    setting and day. Columns are the parameters, "day" and the values.
+    """
+    days = daily[DAY]
+    columns = {name: array for name, array in daily.items() if name != DAY}
+    num_settings = len(next(iter(columns.values())))
+    long = {
+        name: np.repeat(array, len(days))
+        for name, array in columns.items()
+        if array.ndim == 1
+    }
+    long[DAY] = np.tile(days, num_settings)
+    long.update(
+        {name: array.ravel() for name, array in columns.items() if array.ndim == 2}
+    )
+    return pd.DataFrame(long)
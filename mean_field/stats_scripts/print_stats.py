@@ -34,6 +34,7 @@ if os.path.basename(os.getcwd()) != CURR_DIR:
 source_dir = "../src"
 sys.path.insert(0, source_dir)
 from simulations import get_peak_day
+from sweeps import load_daily, long_format, select
 
 print("-" * 75)
 print("Statistics utilized in the paper")
@@ -42,7 +43,7 @@ print("\n")
 
 ### Load simulation results ###
 totals_df = pd.read_csv(os.path.join(RESULTS_DIR, "total_infected_all_settings.csv"))
-by_day_df = pd.read_csv(os.path.join(RESULTS_DIR, "daily_infected_all_settings.csv"))
+by_day = load_daily(os.path.join(RESULTS_DIR, "daily_infected_all_settings.npz"))
 
 ## Select the data we want ##
 # ------------------------- #
@@ -55,17 +56,15 @@ lambda_3 = totals_df[
 ]
 
 # By day for each lambda value
-by_day_lambda_3 = by_day_df[
-    (by_day_df["lambda"] == 3)
-    & (by_day_df["beta"] == 0.3)
-    & (by_day_df["frac_ord"] == 0.5)
-]
+by_day_df = long_format(
+    select(by_day, {"lambda": [1, 3], "beta": 0.3, "frac_ord": 0.5})
+)
+by_day_df["infections_total"] = (
+    by_day_df["infections_mis"] + by_day_df["infections_ord"]
+)
 
-by_day_lambda_1 = by_day_df[
-    (by_day_df["lambda"] == 1)
-    & (by_day_df["beta"] == 0.3)
-    & (by_day_df["frac_ord"] == 0.5)
-]
+by_day_lambda_3 = by_day_df[by_day_df["lambda"] == 3]
+by_day_lambda_1 = by_day_df[by_day_df["lambda"] == 1]
 
 # Select/calculate the values we want to print
 mis_vs_ord_diff = lambda_3["diff"].values[0]  # Misinformed - Ordinary